@@ -5,3 +5,6 @@ class Choice(list):
 
 from .decent_param import *
 from .decent_params_imp import *
+from .sweep import *
+from .validator import *
+from .sources import *
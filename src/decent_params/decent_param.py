@@ -32,6 +32,12 @@ class DecentParam(object):
     
     def validate(self, value):
         self.check_type(value)
+        
+    def signature(self):
+        """ Returns a hashable description of this parameter. """
+        return (self.name, type(self).__name__, self.ptype.__name__,
+                repr(self.default), self.desc, self.short, self.compulsory,
+                self.allow_multi, repr(self.group))
  
     def set_from_string(self, s):
         self._value = self.value_from_string(s)
@@ -87,32 +93,116 @@ class DecentParam(object):
             parser.add_argument(option, **other)
          
 
-class DecentParamsResults():
+# tuple of names -> dict name -> index, shared by the results with those names
+_layouts = {}
+
+
+def get_layout(names):
+    """ Returns the (shared) dict mapping each name to its index. """
+    layout = _layouts.get(names, None)
+    if layout is None:
+        layout = _layouts[names] = dict((k, i) for i, k in enumerate(names))
+    return layout
+
+
+def hashable(x):
+    """ Returns a hashable version of x (lists become tuples, etc.). """
+    if isinstance(x, (list, tuple)):
+        return tuple(map(hashable, x))
+    if isinstance(x, dict):
+        return tuple(sorted((k, hashable(v)) for k, v in x.items()))
+    if isinstance(x, set):
+        return frozenset(map(hashable, x))
+    try:
+        hash(x)
+    except TypeError:
+        return repr(x)
+    return x
+
+
+class DecentParamsResults(object):
+    """
+        The values of the parameters; immutable.
+
+        The values are accessed as attributes or items. They are kept in 
+        a tuple, with the positions given by a layout shared by all the 
+        results with the same parameters.
+        
+        The results can be hashed and compared, so they can be used
+        as keys of a cache.
+    """
+    
+    __slots__ = ['_names', '_layout', '_values', '_given', '_params', 
+                 '_extra', '_hash']
     
     def __init__(self, values, given, params, extra=None):
-        self._values = values
-        self._given = given
-        self._params = params
-        self._extra = extra
+        names = tuple(sorted(values))
+        _set = object.__setattr__
+        _set(self, '_names', names)
+        _set(self, '_layout', get_layout(names))
+        _set(self, '_values', tuple(values[k] for k in names))
+        _set(self, '_given', frozenset(given))
+        _set(self, '_params', params)
+        _set(self, '_extra', extra)
+        _set(self, '_hash', None)
+    
+    def __getattr__(self, name):
+        # only called if it is not a slot
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[self._layout[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DecentParamsResults is immutable.')
     
-        for k, v in values.items():
-            self.__dict__[k] = v 
+    def __reduce__(self):
+        return (DecentParamsResults, (self.get_values(), sorted(self._given), 
+                                      self._params, self._extra))
+    
+    def _key(self):
+        return (self._names, hashable(self._values), self._given, 
+                hashable(self._extra))
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(self._key()))
+        return self._hash
+    
+    def __eq__(self, other):
+        if not isinstance(other, DecentParamsResults):
+            return False
+        return (self._names == other._names and self._values == other._values
+                and self._given == other._given and self._extra == other._extra)
+    
+    def __ne__(self, other):
+        return not self == other
     
     def __repr__(self):
-        return 'DecentParamsResults(%r,given=%r,extra=%r)' % (self._values, self._given, self._extra)
+        return 'DecentParamsResults(%r,given=%r,extra=%r)' % (self.get_values(), 
+                                                              sorted(self._given), 
+                                                              self._extra)
     
     def __str__(self):
-        return 'DPR(values=%s;given=%s;extra=%s)' % (self._values, self._given, self._extra)
+        return 'DPR(values=%s;given=%s;extra=%s)' % (self.get_values(), 
+                                                     sorted(self._given), 
+                                                     self._extra)
     
     def get_extra(self):
         return self._extra
     
+    def get_values(self):
+        """ Returns a dict with the values of all parameters. """
+        return dict(zip(self._names, self._values))
+    
     def get_params(self):
         """ Returns the DecentParams structure which originated these results. """
         return self._params 
     
     def __getitem__(self, name):
-        return self._values[name]
+        return self._values[self._layout[name]]
         
     def given(self, name):
         return name in self._given
@@ -160,6 +250,9 @@ class DecentParamChoice(DecentParam):
         self.choices = choices
         DecentParam.__init__(self, **args)
         
+    def signature(self):
+        return DecentParam.signature(self) + (repr(self.choices),)
+        
     def validate(self, value):
         if not value in self.choices:
             msg = 'Not %r in %r' % (value, self.choices)
@@ -2,12 +2,11 @@ from .decent_param import (DecentParamFlag, DecentParam, DecentParamMultiple,
     DecentParamChoice, DecentParamsResults)
 from .exceptions import (DecentParamsUnknownArgs, DecentParamsDefinitionError,
     DecentParamsUserError)
+from .validator import get_validator
 from argparse import RawTextHelpFormatter
 from contracts import contract
-from decent_params import Choice
 from pprint import pformat
 import argparse
-import warnings
 
 __all__ = ['DecentParams']
 
@@ -18,6 +17,11 @@ class DecentParams(object):
         self.prog = prog
         self.params = {}
         self.accepts_extra = False
+        # signatures of the params, in the order they were added
+        self._signatures = []
+        # computed on demand; reset when the spec changes
+        self._signature = None
+        self._validator = None
     
     def __str__(self):
         return 'DecentParams(%s;extra=%s)' % (pformat(self.params), self.accepts_extra) 
@@ -28,10 +32,28 @@ class DecentParams(object):
             raise DecentParamsDefinitionError(msg)
         p.order = len(self.params)
         self.params[p.name] = p
+        self._signatures.append(p.signature())
+        self._changed()
+        
+    def _changed(self):
+        """ Called when the spec changes, to reset what depends on it. """
+        self._signature = None
+        self._validator = None
+        
+    def signature(self):
+        """ 
+            Returns a hashable description of the spec; two specs with
+            the same signature produce the same parser.
+        """
+        if self._signature is None:
+            self._signature = ((self.usage, self.prog, self.accepts_extra) + 
+                               tuple(self._signatures))
+        return self._signature
         
     def accept_extra(self):
         """ Declares that extra arguments are ok. """
         self.accepts_extra = True
+        self._changed()
           
     def add_flag(self, name, **args):
         self._add(DecentParamFlag(ptype=bool, name=name, default=False, **args))
@@ -89,19 +111,26 @@ class DecentParams(object):
         values, given = self._interpret_args(argparse_res)
         return values, given
     
-    @contract(args='list(str)', returns='tuple(dict, list(str), list(str))')    
-    def parse_using_parser_extra(self, parser, args):
+    @contract(args='list(str)', returns='tuple(dict, list(str), list(str))',
+              values='None|dict(str:*)')    
+    def parse_using_parser_extra(self, parser, args, values=None):
         """ 
-            This returns also the extra parameters
+            This returns also the extra parameters.
+            
+            The ``values`` given (e.g. read from a configuration file)
+            are used instead of the defaults, unless given in args.
             
             returns: values, given, argv
         """
         
-        if self.accepts_extra:
+        # the parser might be reused (see get_dpr_from_args())
+        if (self.accepts_extra and 
+            not any(a.dest == 'remainder' for a in parser._actions)):
             parser.add_argument('remainder', nargs=argparse.REMAINDER)
 
         try:
-            argparse_res, unknown = parser.parse_known_args(args)
+            namespace = argparse.Namespace(**(values or {}))
+            argparse_res, unknown = parser.parse_known_args(args, namespace)
         except SystemExit:
             raise  # XXX
         
@@ -123,38 +152,7 @@ class DecentParams(object):
     
     @contract(parsed='dict', returns='tuple(dict, list(str))')
     def _interpret_args2(self, parsed):
-        values = dict()
-        given = set()
-        for k, v in self.params.items():
-            # if v.compulsory and parsed[k] is None:
-            if v.compulsory and (not k in parsed or parsed[k] is None):
-                msg = 'Compulsory option %r not given.' % k
-                raise DecentParamsUserError(self, msg)
-            
-            warnings.warn('Not sure below')
-            # if parsed[k] is not None:
-            if k in parsed and parsed[k] is not None:
-                if parsed[k] != self.params[k].default:
-                    given.add(k)
-                    if isinstance(self.params[k], DecentParamMultiple):
-                        if isinstance(parsed[k], list):
-                            values[k] = parsed[k]
-                        else:
-                            values[k] = [parsed[k]]
-                    else:
-                        if isinstance(parsed[k], list):
-                            if len(parsed[k]) > 1:
-                                values[k] = Choice(parsed[k])
-                            else:
-                                values[k] = parsed[k][0]
-                        else:
-                            values[k] = parsed[k]
-                    # values[k] = self.params[k].value_from_string(parsed[k])
-                else:
-                    values[k] = self.params[k].default
-            else:
-                values[k] = self.params[k].default
-        return values, list(given) 
+        return get_validator(self).interpret(self, parsed)
         
     def _populate_parser(self, option_container, prog=None):
         groups = set(p.group for p in self.params.values())
@@ -195,10 +193,21 @@ class DecentParams(object):
     
     @contract(args='list(str)')
     def get_dpr_from_args(self, args, prog=None, usage=None, epilog=None,
-                          description=None):
-        parser = self.create_parser(prog=prog, usage=usage, epilog=epilog, description=description)
+                          description=None, parser=None, values=None):
+        """ 
+            If ``parser`` is given, it must have been created by 
+            create_parser() for a spec with the same signature(); 
+            it is reused instead of creating a new one.
+            
+            If given, ``values`` overrides the defaults (see 
+            parse_using_parser_extra()).
+        """
+        if parser is None:
+            parser = self.create_parser(prog=prog, usage=usage, epilog=epilog,
+                                        description=description)
 
-        values, given, extra = self.parse_using_parser_extra(parser, args)
+        values, given, extra = self.parse_using_parser_extra(parser, args,
+                                                             values=values)
         if extra and not self.accepts_extra:
             msg = 'Found extra arguments not accepted: %s' % extra
             raise DecentParamsUserError(self, msg)
@@ -209,7 +218,5 @@ class DecentParams(object):
     @contract(config='dict(str:*)')
     def get_dpr_from_dict(self, config):
         extra = []  # TODO 
-        values, given = self._interpret_args2(config)
-        dpr = DecentParamsResults(values, given, self, extra=extra)
-        return dpr
+        return get_validator(self).get_dpr(self, config, extra=extra)
 
@@ -0,0 +1,40 @@
+from decent_params import DecentParams, DecentParamsResults
+import cPickle as pickle
+import unittest
+
+
+def spec():
+    p = DecentParams()
+    p.add_int('a', default=0)
+    p.add_float_list('b', default=[1.0])
+    return p
+
+
+class ResultsTest(unittest.TestCase):
+
+    def results_test(self):
+        dpr = spec().get_dpr_from_dict(dict(a=2))
+        self.assertEqual((dpr.a, dpr['b'], dpr.get_values()), (2, [1.0],
+                                                               dict(a=2, b=[1.0])))
+        self.assertTrue(dpr.given('a'))
+        self.assertFalse(dpr.given('b'))
+        self.assertRaises(AttributeError, getattr, dpr, 'c')
+        self.assertRaises(AttributeError, setattr, dpr, 'a', 3)
+        self.assertFalse(hasattr(dpr, '__dict__'))
+
+    def hash_test(self):
+        p = spec()
+        dpr1 = p.get_dpr_from_dict(dict(a=2, b=[3.0]))
+        dpr2 = p.get_dpr_from_dict(dict(a=2, b=[3.0]))
+        dpr3 = p.get_dpr_from_dict(dict(a=2, b=[4.0]))
+        self.assertEqual(dpr1, dpr2)
+        self.assertNotEqual(dpr1, dpr3)
+        cache = {dpr1: 'x'}
+        self.assertEqual(cache.get(dpr2), 'x')
+        self.assertFalse(dpr3 in cache)
+
+    def pickle_test(self):
+        dpr = DecentParamsResults(dict(a=1), ['a'], None, extra=['e'])
+        dpr2 = pickle.loads(pickle.dumps(dpr, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(dpr, dpr2)
+        self.assertEqual(dpr2.get_extra(), ['e'])
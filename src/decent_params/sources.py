@@ -0,0 +1,158 @@
+"""
+    Sources of values for the parameters other than the command line:
+    configuration files (JSON, YAML, INI) and environment variables.
+
+    The values of the text sources (INI files, environment variables)
+    are strings, interpreted as on the command line, so that, for
+    example, "1,2" is a Choice.
+"""
+from .decent_param import DecentParamFlag
+from .exceptions import DecentParamsUserError
+from ConfigParser import RawConfigParser
+from contracts import contract
+import cPickle as pickle
+import hashlib
+import json
+import os
+
+__all__ = ['config_from_env', 'read_config_file', 'config_formats']
+
+config_formats = {'.json': 'json', '.yaml': 'yaml', '.yml': 'yaml',
+                  '.ini': 'ini', '.cfg': 'ini'}
+
+_true = ['1', 'true', 'yes', 'on']
+_false = ['0', 'false', 'no', 'off']
+
+
+def value_from_text(params, name, s):
+    """ Interprets the string s given for the parameter name. """
+    p = params.params[name]
+    if isinstance(p, DecentParamFlag):
+        if s.lower() in _true:
+            return True
+        if s.lower() in _false:
+            return False
+        msg = 'Invalid value %r for flag %r.' % (s, name)
+        raise DecentParamsUserError(params, msg)
+    try:
+        return p.value_from_string(s)
+    except ValueError as e:
+        msg = 'Invalid value %r for option %r: %s' % (s, name, e)
+        raise DecentParamsUserError(params, msg)
+
+
+@contract(prefix='str', returns='dict(str:*)')
+def config_from_env(params, prefix, environ=None):
+    """
+        Returns the values given in the environment: the value of
+        the parameter "name" is in the variable <prefix><NAME>.
+    """
+    if environ is None:
+        environ = os.environ
+    values = {}
+    for name in params.params:
+        var = prefix + name.upper()
+        if var in environ:
+            values[name] = value_from_text(params, name, environ[var])
+    return values
+
+
+def _yaml():
+    """ Returns the yaml module, if the optional package is installed. """
+    try:
+        import yaml  # @UnresolvedImport
+    except ImportError:
+        return None
+    return yaml
+
+
+def parse_config_file(params, filename):
+    """ Reads the file and returns the values, as a dict. """
+    ext = os.path.splitext(filename)[1].lower()
+    if not ext in config_formats:
+        msg = ('Unknown format of %r; the known extensions are %s.' %
+               (filename, sorted(config_formats)))
+        raise DecentParamsUserError(params, msg)
+    fmt = config_formats[ext]
+    if fmt == 'ini':
+        parser = RawConfigParser()
+        parser.optionxform = str  # keep the case
+        parser.read([filename])
+        values = {}
+        for section in parser.sections():
+            for name, s in parser.items(section):
+                values[name] = s
+    else:
+        with open(filename) as f:
+            if fmt == 'json':
+                values = json.load(f)
+            else:
+                yaml = _yaml()
+                if yaml is None:
+                    msg = 'Reading %r needs the package PyYAML.' % filename
+                    raise DecentParamsUserError(params, msg)
+                values = yaml.safe_load(f)
+        if not isinstance(values, dict):
+            msg = 'Expected a dict in %r, got %r.' % (filename, type(values))
+            raise DecentParamsUserError(params, msg)
+    unknown = sorted(set(values) - set(params.params))
+    if unknown:
+        msg = 'Unknown options in %r: %s' % (filename, unknown)
+        raise DecentParamsUserError(params, msg)
+    res = {}
+    for name, value in values.items():
+        name = str(name)
+        value = no_unicode(value)
+        if fmt == 'ini':
+            value = value_from_text(params, name, value)
+        res[name] = value
+    return res
+
+
+def no_unicode(x):
+    """ Converts the unicode strings (also in lists and dicts) to str. """
+    if isinstance(x, unicode):
+        return str(x)
+    if isinstance(x, list):
+        return map(no_unicode, x)
+    if isinstance(x, dict):
+        return dict((no_unicode(k), no_unicode(v)) for k, v in x.items())
+    return x
+
+
+@contract(filename='str', cache_dir='None|str', returns='dict(str:*)')
+def read_config_file(params, filename, cache_dir=None):
+    """
+        Returns the values given in the configuration file
+        (JSON, YAML or INI, by extension; for INI, all sections are read).
+
+        If cache_dir is given, the values are saved there, and are read
+        from there as long as the file and the spec do not change.
+    """
+    if not os.path.exists(filename):
+        msg = 'Configuration file %r does not exist.' % filename
+        raise DecentParamsUserError(params, msg)
+    if cache_dir is None:
+        return parse_config_file(params, filename)
+
+    filename = os.path.realpath(filename)
+    st = os.stat(filename)
+    stamp = (st.st_mtime, st.st_size, params.signature())
+    h = hashlib.sha1(filename).hexdigest()
+    cache = os.path.join(cache_dir, 'config-%s.pickle' % h)
+    if os.path.exists(cache):
+        try:
+            with open(cache, 'rb') as f:
+                cached_stamp, values = pickle.load(f)
+            if cached_stamp == stamp:
+                return values
+        except Exception:
+            pass
+    values = parse_config_file(params, filename)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    tmp = '%s.tmp%s' % (cache, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump((stamp, values), f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, cache)
+    return values
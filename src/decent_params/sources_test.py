@@ -0,0 +1,66 @@
+from decent_params import (DecentParams, Choice, UserError, config_from_env,
+    read_config_file)
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def spec():
+    p = DecentParams()
+    p.add_int('a', default=0)
+    p.add_float('b', default=1.0)
+    p.add_flag('c')
+    p.add_string_list('d', default=['x'])
+    return p
+
+
+class SourcesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, s):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'w') as f:
+            f.write(s)
+        return filename
+
+    def env_test(self):
+        environ = dict(APP_A='1,2', APP_C='yes', APP_D='u,v', OTHER_B='3')
+        values = config_from_env(spec(), 'APP_', environ)
+        self.assertEqual(values, dict(a=Choice([1, 2]), c=True, d=['u', 'v']))
+        self.assertRaises(UserError, config_from_env, spec(), 'APP_',
+                          dict(APP_C='maybe'))
+
+    def files_test(self):
+        p = spec()
+        ini = self.write('o.ini', '[options]\na = 3\nc = false\n')
+        self.assertEqual(read_config_file(p, ini), dict(a=3, c=False))
+        js = self.write('o.json', json.dumps(dict(b=2.5, d=['y'])))
+        self.assertEqual(read_config_file(p, js), dict(b=2.5, d=['y']))
+        wrong = self.write('w.json', json.dumps(dict(e=1)))
+        self.assertRaises(UserError, read_config_file, p, wrong)
+
+    def cache_test(self):
+        p = spec()
+        js = self.write('o.json', json.dumps(dict(a=1)))
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.assertEqual(read_config_file(p, js, cache_dir), dict(a=1))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # the cached values are used if the file did not change
+        cache = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        os.utime(cache, None)
+        self.assertEqual(read_config_file(p, js, cache_dir), dict(a=1))
+        self.write('o.json', json.dumps(dict(a=22)))
+        self.assertEqual(read_config_file(p, js, cache_dir), dict(a=22))
+
+    def precedence_test(self):
+        p = spec()
+        dpr = p.get_dpr_from_args(['--a', '5'], values=dict(a=3, b=2.0))
+        self.assertEqual((dpr.a, dpr.b, dpr.c), (5, 2.0, False))
+        self.assertTrue(dpr.given('b'))
@@ -0,0 +1,69 @@
+from .decent_param import DecentParamsResults
+from contracts import contract
+from decent_params import Choice
+import itertools
+
+__all__ = ['sweep_axes', 'iterate_combinations']
+
+
+@contract(zipped='list(list(str))', returns='list(list(str))')
+def sweep_axes(dpr, zipped=[]):
+    """
+        Returns the axes of the sweep described by the results: a list of
+        lists of parameter names. Each parameter whose value is a Choice
+        is an axis by itself, unless it belongs to one of the ``zipped``
+        groups, whose parameters change together.
+    """
+    values = dpr.get_values()
+    swept = sorted(k for k, v in values.items() if isinstance(v, Choice))
+    axes = []
+    in_groups = set()
+    for group in zipped:
+        for name in group:
+            if not name in values:
+                raise ValueError('Unknown parameter %r in %r.' % (name, group))
+            if not isinstance(values[name], Choice):
+                msg = 'Parameter %r in %r is not a Choice.' % (name, group)
+                raise ValueError(msg)
+            if name in in_groups:
+                raise ValueError('Parameter %r zipped twice.' % name)
+            in_groups.add(name)
+        lengths = set(len(values[name]) for name in group)
+        if len(lengths) > 1:
+            msg = 'The parameters in %r have different lengths.' % group
+            raise ValueError(msg)
+        axes.append(sorted(group))
+    axes.extend([k] for k in swept if not k in in_groups)
+    axes.sort()
+    return axes
+
+
+def iterate_combinations(dpr, zipped=[], where=None):
+    """
+        Iterates over the combinations of the values of the parameters
+        that are Choice instances (the Cartesian product of the axes given
+        by sweep_axes()).
+
+        Yields tuples (chosen, dpr), where chosen is a dict with the values
+        of the swept parameters and dpr is a DecentParamsResults without
+        Choices. If ``where`` is given, only the combinations for which
+        ``where(values)`` is true are generated.
+
+        The combinations are generated lazily, so that the memory does not
+        depend on their number.
+    """
+    values = dpr.get_values()
+    axes = sweep_axes(dpr, zipped)
+    # for each axis, the list of tuples of values
+    axis_values = [zip(*[values[k] for k in axis]) for axis in axes]
+    given = [k for k in values if dpr.given(k)]
+    for combination in itertools.product(*axis_values):
+        chosen = {}
+        for axis, xs in zip(axes, combination):
+            chosen.update(zip(axis, xs))
+        values_i = dict(values)
+        values_i.update(chosen)
+        if where is not None and not where(values_i):
+            continue
+        yield chosen, DecentParamsResults(values_i, given, dpr.get_params(),
+                                          extra=dpr.get_extra())
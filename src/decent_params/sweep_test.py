@@ -0,0 +1,42 @@
+from decent_params import DecentParams, Choice, iterate_combinations
+import unittest
+
+
+def sweep_params():
+    p = DecentParams()
+    p.add_int('a', default=0)
+    p.add_float('b', default=0.0)
+    p.add_string('c', default='x')
+    p.add_string('d', default='y')
+    return p
+
+
+class SweepTest(unittest.TestCase):
+
+    def product_test(self):
+        p = sweep_params()
+        dpr = p.get_dpr_from_dict(dict(a=Choice([1, 2, 3]), b=Choice([0.5, 1.5])))
+        res = list(iterate_combinations(dpr))
+        self.assertEqual(len(res), 6)
+        chosen, dpr0 = res[0]
+        self.assertEqual(chosen, dict(a=1, b=0.5))
+        self.assertEqual((dpr0.a, dpr0.b, dpr0.c), (1, 0.5, 'x'))
+        self.assertTrue(dpr0.given('a'))
+        self.assertFalse(dpr0.given('c'))
+
+    def zip_where_test(self):
+        p = sweep_params()
+        dpr = p.get_dpr_from_dict(dict(a=Choice([1, 2, 3]), b=Choice([0.5, 1.5, 2.5]),
+                                       c=Choice(['u', 'v'])))
+        res = list(iterate_combinations(dpr, zipped=[['a', 'b']],
+                                        where=lambda v: v['a'] != 2))
+        self.assertEqual(sorted((x['a'], x['b'], x['c']) for x, _ in res),
+                         [(1, 0.5, 'u'), (1, 0.5, 'v'), (3, 2.5, 'u'), (3, 2.5, 'v')])
+        self.assertRaises(ValueError, list,
+                          iterate_combinations(dpr, zipped=[['a', 'c']]))
+        self.assertRaises(ValueError, list,
+                          iterate_combinations(dpr, zipped=[['a', 'd']]))
+
+    def nothing_to_sweep_test(self):
+        dpr = sweep_params().get_dpr_from_dict(dict(a=1))
+        self.assertEqual([x for x, _ in iterate_combinations(dpr)], [{}])
@@ -0,0 +1,99 @@
+from .decent_param import DecentParamMultiple, DecentParamsResults
+from .exceptions import DecentParamsUserError
+from decent_params import Choice
+
+__all__ = ['DictValidator', 'get_validator']
+
+
+def coercer_for(ptype):
+    """
+        Returns a function converting a value to the given type;
+        only strings given for numeric parameters are converted.
+    """
+    if ptype in (int, float):
+        def coerce(x):
+            if isinstance(x, str):
+                return ptype(x)
+            return x
+        return coerce
+    return None
+
+
+class DictValidator(object):
+    """
+        The spec of a DecentParams compiled for interpreting dicts of
+        values: the defaults, the compulsory parameters and the
+        conversions are computed once, so that each dict is interpreted
+        in a single pass over the parameters.
+
+        The result is the same as DecentParams._interpret_args2().
+    """
+
+    def __init__(self, params):
+        # list of (name, default, compulsory, multiple, coerce)
+        self.entries = []
+        for name in sorted(params.params):
+            p = params.params[name]
+            self.entries.append((name, p.default, p.compulsory,
+                                 isinstance(p, DecentParamMultiple),
+                                 coercer_for(p.ptype)))
+
+    def interpret(self, params, parsed):
+        """
+            Returns values, given for the dict ``parsed``; params is
+            only used for the error messages.
+        """
+        values = {}
+        given = []
+        for name, default, compulsory, multiple, coerce in self.entries:
+            x = parsed.get(name, None)
+            if x is None:
+                if compulsory:
+                    msg = 'Compulsory option %r not given.' % name
+                    raise DecentParamsUserError(params, msg)
+                values[name] = default
+                continue
+            if coerce is not None:
+                try:
+                    if isinstance(x, list):
+                        x = type(x)(map(coerce, x))
+                    else:
+                        x = coerce(x)
+                except ValueError as e:
+                    msg = 'Invalid value %r for option %r: %s' % (x, name, e)
+                    raise DecentParamsUserError(params, msg)
+            if x == default:
+                values[name] = default
+                continue
+            given.append(name)
+            if multiple:
+                values[name] = x if isinstance(x, list) else [x]
+            elif isinstance(x, list):
+                values[name] = Choice(x) if len(x) > 1 else x[0]
+            else:
+                values[name] = x
+        return values, given
+
+    def get_dpr(self, params, config, extra=[]):
+        """ Returns the DecentParamsResults for the dict config. """
+        values, given = self.interpret(params, config)
+        return DecentParamsResults(values, given, params, extra=extra)
+
+
+# signature -> DictValidator
+_validators = {}
+
+
+def get_validator(params):
+    """ 
+        Returns the DictValidator for the spec, compiling it only once;
+        it is kept in the DecentParams until the spec changes.
+    """
+    validator = params._validator
+    if validator is None:
+        key = params.signature()
+        validator = _validators.get(key, None)
+        if validator is None:
+            validator = _validators[key] = DictValidator(params)
+        params._validator = validator
+    return validator
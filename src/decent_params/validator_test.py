@@ -0,0 +1,36 @@
+from decent_params import DecentParams, Choice, get_validator, UserError
+import unittest
+
+
+def spec():
+    p = DecentParams()
+    p.add_int('a')
+    p.add_float('b', default=1.0)
+    p.add_string('c', default='x')
+    p.add_int_list('d', default=[1])
+    return p
+
+
+class ValidatorTest(unittest.TestCase):
+
+    def validator_test(self):
+        p = spec()
+        dpr = p.get_dpr_from_dict(dict(a='2', c=['u', 'v'], d=3, unknown=1))
+        self.assertEqual((dpr.a, dpr.b, dpr.d), (2, 1.0, [3]))
+        self.assertEqual(dpr.c, Choice(['u', 'v']))
+        self.assertTrue(isinstance(dpr.c, Choice))
+        self.assertEqual(sorted(k for k in 'abcd' if dpr.given(k)),
+                         ['a', 'c', 'd'])
+        # the same value as the default is not "given"
+        self.assertFalse(p.get_dpr_from_dict(dict(a=1, b='1.0')).given('b'))
+
+    def errors_test(self):
+        p = spec()
+        self.assertRaises(UserError, p.get_dpr_from_dict, dict(b=2.0))
+        self.assertRaises(UserError, p.get_dpr_from_dict, dict(a='two'))
+
+    def cache_test(self):
+        self.assertTrue(get_validator(spec()) is get_validator(spec()))
+        p = spec()
+        p.add_flag('e')
+        self.assertFalse(get_validator(p) is get_validator(spec()))
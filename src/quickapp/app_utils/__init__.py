@@ -1 +1,2 @@
 from .subcontexts import *
+from .sweep import *
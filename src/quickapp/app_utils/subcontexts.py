@@ -1,3 +1,4 @@
+from ..utils.hot_contracts import contract_hot
 from contracts import contract
 import os
 
@@ -60,7 +61,7 @@ def iterate_context_names_quintuplet(context, it1, it2, it3, it4, it5):
                         yield c5, x1, x2, x3, x4, x5
                         
                         
-@contract(id_object='str', returns='str')
+@contract_hot(id_object='str', returns='str')
 def good_context_name(id_object):
     """ 
         Removes strange characters from a string to make it a good 
@@ -71,7 +72,7 @@ def good_context_name(id_object):
     return id_object
 
 
-@contract(objects='seq[N](str)', returns='tuple(str, list[N](str), str)')
+@contract_hot(objects='seq[N](str)', returns='tuple(str, list[N](str), str)')
 def minimal_names(objects):
     """
         Converts a list of object IDs to a minimal non-ambiguous list of names.
@@ -0,0 +1,37 @@
+from .subcontexts import good_context_name, minimal_names_at_boundaries
+from decent_params import sweep_axes, iterate_combinations
+
+__all__ = ['iterate_context_sweep']
+
+
+def iterate_context_sweep(context, options, zipped=[], where=None):
+    """
+        Expands the parameters of ``options`` (a DecentParamsResults) whose
+        value is a Choice, creating one child context for each combination.
+
+        Yields tuples (context, options), where options has no Choices;
+        if there is nothing to sweep, the context itself is used.
+        See iterate_combinations() for ``zipped`` and ``where``.
+
+        The child is called, for example, "alpha1_beta0.5", using for
+        each parameter the minimal non-ambiguous names of its values.
+        The combinations are generated lazily, so that large sweeps
+        are defined in constant memory.
+    """
+    values = options.get_values()
+    # param -> value -> name, computed once for each parameter
+    names = {}
+    for axis in sweep_axes(options, zipped):
+        for k in axis:
+            xs = values[k]
+            _, minimal, _ = minimal_names_at_boundaries(map(str, xs))
+            names[k] = dict(zip(map(str, xs), map(good_context_name, minimal)))
+
+    for chosen, options_i in iterate_combinations(options, zipped, where):
+        if not chosen:
+            # nothing to sweep
+            yield context, options_i
+            continue
+        name = '_'.join('%s%s' % (k, names[k][str(chosen[k])])
+                        for k in sorted(chosen))
+        yield context.child(name), options_i
@@ -0,0 +1 @@
+""" Benchmarks for the job-definition path. """
@@ -0,0 +1,71 @@
+""" 
+    Measures the time needed to define jobs with and without the
+    contracts wrappers on the definition-time methods.
+    
+    Usage: ::
+    
+        python -m quickapp.benchmarks.contracts_overhead [njobs]
+"""
+from compmake import set_compmake_db
+from quickapp import CompmakeContext
+from quickapp.quick_app import set_definition_contracts
+import contracts
+import shutil
+import sys
+import tempfile
+import time
+
+
+def dummy(x):
+    return x
+
+
+def define_jobs(context, njobs):
+    """ Defines njobs jobs, with one child context and report every 10. """
+    for i in range(njobs):
+        if i % 10 == 0:
+            c = context.child('c%d' % i)
+        r = c.comp(dummy, i)
+        if i % 10 == 0:
+            c.add_report(r, 'dummy', i=i)
+
+
+def time_definition(njobs, use_contracts, wrappers):
+    """ 
+        Returns the seconds needed to define njobs jobs.
+        
+        use_contracts: whether the contracts are checked.
+        wrappers: whether the definition-time methods keep their wrappers.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # in-memory DB, so that we measure only the definition overhead 
+        set_compmake_db({})
+        if use_contracts:
+            contracts.enable_all()
+        else:
+            contracts.disable_all()
+        set_definition_contracts(wrappers)
+        prefix = 'bench%d%d' % (use_contracts, wrappers)
+        context = CompmakeContext(qapp=None, parent=None, job_prefix=prefix,
+                                  output_dir=tmpdir)
+        t0 = time.time()
+        define_jobs(context, njobs)
+        return time.time() - t0
+    finally:
+        set_definition_contracts(True)
+        shutil.rmtree(tmpdir)
+
+
+def main(njobs=10000):
+    modes = [('contracts checked', True, True),
+             ('contracts disabled', False, True),
+             ('wrappers removed', False, False)]
+    for name, use_contracts, wrappers in modes:
+        t = time_definition(njobs, use_contracts, wrappers)
+        print('%-20s %6d jobs: %6.2f s  (%.2f s per 10k jobs)' % 
+              (name, njobs, t, t * 10000.0 / njobs))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,187 @@
+"""
+    Benchmark of the job-definition path.
+
+    Builds synthetic apps with N jobs, D nesting levels of context.child(),
+    R reports and S resources, and measures, for the phases
+    define_jobs_context() and finalize_jobs(), the wall time, the peak
+    memory and the size of the compmake DB.
+
+    Each configuration runs in a separate process, so that the peak memory
+    of one does not affect the others. Usage: ::
+
+        python -m quickapp.benchmarks.definition --jobs 1000 10000 --depth 1 5
+
+"""
+from compmake import set_compmake_db
+from compmake.storage.filesystem import StorageFilesystem
+from compmake.ui.ui import reset_jobs_definition_set
+from quickapp import QuickApp, QuickAppBase, CompmakeContext, quickapp_main
+from quickapp.quick_app import set_definition_contracts
+import cPickle as pickle
+import contracts
+import itertools
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+__all__ = ['SyntheticApp', 'DefinitionBenchmark', 'benchmark_definition']
+
+
+def make_data(i):
+    return i
+
+
+def process(data, i):
+    return i
+
+
+def make_report(result):
+    return result
+
+
+def provide_data(context, i):
+    return context.comp(make_data, i)
+
+
+class SyntheticApp(QuickApp):
+    """ An app that defines the given number of jobs, reports, resources. """
+
+    cmd = 'synthetic'
+
+    def define_options(self, params):
+        params.add_int('jobs', help='Number of jobs', default=1000)
+        params.add_int('depth', help='Levels of nested contexts', default=1)
+        params.add_int('reports', help='Number of reports', default=0)
+        params.add_int('resources', help='Number of resources', default=0)
+
+    def define_jobs_context(self, context):
+        options = self.get_options()
+        rm = context.get_resource_manager()
+        rm.set_resource_provider('data', provide_data)
+
+        # the jobs are divided among the leaves of a chain of contexts
+        contexts = [context]
+        for d in range(options.depth):
+            contexts.append(contexts[-1].child('level%d' % d))
+
+        for i in range(options.jobs):
+            c = contexts[i % len(contexts)]
+            if options.resources:
+                data = c.get_resource('data', i=i % options.resources)
+            else:
+                data = None
+            r = c.comp(process, data, i)
+            if i < options.reports:
+                c.add_report(c.comp(make_report, r), 'synthetic', i=i)
+
+
+def db_size(db):
+    """ Returns the size in bytes of the compmake DB. """
+    if isinstance(db, StorageFilesystem):
+        total = 0
+        for dirpath, _, filenames in os.walk(db.basepath):
+            for f in filenames:
+                total += os.path.getsize(os.path.join(dirpath, f))
+        return total
+    else:
+        return sum(len(pickle.dumps(v, pickle.HIGHEST_PROTOCOL))
+                   for v in db.values())
+
+
+def peak_memory():
+    """ Returns the peak resident memory of this process, in MB. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def benchmark_definition(jobs, depth, reports, resources, storage='memory',
+                         use_contracts=False):
+    """
+        Defines the jobs of a SyntheticApp and returns a list of
+        dicts (phase, seconds, peak_mb, db_bytes) for the phases
+        "define" and "finalize".
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        if storage == 'memory':
+            db = {}
+        else:
+            db = StorageFilesystem(os.path.join(tmpdir, 'compmake'), compress=True)
+        set_compmake_db(db)
+        reset_jobs_definition_set()
+        if not use_contracts:
+            contracts.disable_all()
+        set_definition_contracts(use_contracts)
+
+        app = SyntheticApp()
+        app.set_options_from_args(['--jobs', str(jobs), '--depth', str(depth),
+                                   '--reports', str(reports),
+                                   '--resources', str(resources)])
+        context = CompmakeContext(qapp=app, parent=None, job_prefix=None,
+                                  output_dir=tmpdir)
+        results = []
+
+        def phase(name, f):
+            t0 = time.time()
+            f()
+            results.append(dict(phase=name, seconds=time.time() - t0,
+                                peak_mb=peak_memory(), db_bytes=db_size(db)))
+
+        phase('define', lambda: app.define_jobs_context(context))
+        phase('finalize', context.finalize_jobs)
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _run_in_child(queue, kwargs):
+    queue.put(benchmark_definition(**kwargs))
+
+
+def benchmark_definition_isolated(**kwargs):
+    """ Runs benchmark_definition() in a separate process. """
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_run_in_child, args=(queue, kwargs))
+    p.start()
+    results = queue.get()
+    p.join()
+    return results
+
+
+class DefinitionBenchmark(QuickAppBase):
+    """ Measures the time needed to define the jobs of synthetic apps. """
+
+    cmd = 'quickapp-bench-definition'
+
+    def define_program_options(self, params):
+        params.add_int_list('jobs', help='Number of jobs', default=[1000, 10000])
+        params.add_int_list('depth', help='Levels of nested contexts', default=[1])
+        params.add_int_list('reports', help='Number of reports', default=[100])
+        params.add_int_list('resources', help='Number of resources', default=[10])
+        params.add_string_choice('storage', ['memory', 'filesystem'],
+                                 help='Compmake DB used', default='memory')
+        params.add_flag('contracts', help='Keep the contracts checks')
+
+    def go(self):
+        options = self.get_options()
+        print('%8s %6s %8s %9s  %-8s %9s %9s %12s' %
+              ('jobs', 'depth', 'reports', 'resources', 'phase', 'seconds',
+               'peak MB', 'DB bytes'))
+        configs = itertools.product(options.jobs, options.depth,
+                                    options.reports, options.resources)
+        for jobs, depth, reports, resources in configs:
+            results = benchmark_definition_isolated(jobs=jobs, depth=depth,
+                                                    reports=reports,
+                                                    resources=resources,
+                                                    storage=options.storage,
+                                                    use_contracts=options.contracts)
+            for r in results:
+                print('%8d %6d %8d %9d  %-8s %9.3f %9.1f %12d' %
+                      (jobs, depth, reports, resources, r['phase'],
+                       r['seconds'], r['peak_mb'], r['db_bytes']))
+
+
+if __name__ == '__main__':
+    quickapp_main(DefinitionBenchmark)
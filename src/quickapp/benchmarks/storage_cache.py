@@ -0,0 +1,55 @@
+"""
+    Measures how many values per second can be read from the compressed
+    filesystem storage, with and without the MemoryCache in front, when
+    the same keys are read repeatedly (as compmake does with the job
+    caches while scheduling).
+
+    Usage: ::
+
+        python -m quickapp.benchmarks.storage_cache [nkeys] [nreads]
+"""
+from compmake.storage.filesystem import StorageFilesystem
+from quickapp.storage import MemoryCache
+import contracts
+import shutil
+import sys
+import tempfile
+import time
+
+
+def make_value(i):
+    """ Something like the cache of a job. """
+    return dict(job_id='job%d' % i, state=4, timestamp=1.0 * i,
+                walltime_used=0.1, cputime_used=0.1, host='host',
+                captured_stdout=None, captured_stderr=None,
+                exception=None, backtrace=None, data=range(100))
+
+
+def throughput(db, keys, nreads):
+    """ Returns the number of reads per second of the keys. """
+    t0 = time.time()
+    for _ in range(nreads):
+        for key in keys:
+            db[key]
+    return nreads * len(keys) / max(time.time() - t0, 1e-9)
+
+
+def main(nkeys=200, nreads=20):
+    contracts.disable_all()
+    dirname = tempfile.mkdtemp()
+    try:
+        keys = ['job%d' % i for i in range(nkeys)]
+        fs = StorageFilesystem(dirname, compress=True)
+        for i, key in enumerate(keys):
+            fs[key] = make_value(i)
+        cached = MemoryCache(StorageFilesystem(dirname, compress=True))
+        for name, db in [('filesystem', fs), ('filesystem-cached', cached)]:
+            print('%-20s %8.0f reads per second' %
+                  (name, throughput(db, keys, nreads)))
+        print('cache: %d hits, %d misses' % (cached.hits, cached.misses))
+    finally:
+        shutil.rmtree(dirname)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
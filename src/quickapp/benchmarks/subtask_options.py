@@ -0,0 +1,81 @@
+""" 
+    Measures how many times per second the options of a subtask can be
+    set, from a dict (as context.subtask() does) and from a list of
+    command line arguments.
+    
+    Usage: ::
+    
+        python -m quickapp.benchmarks.subtask_options [n]
+"""
+from decent_params import DecentParams
+from quickapp import QuickAppBase
+import contracts
+import sys
+import time
+
+
+class OptionsApp(QuickAppBase):
+    """ An app with a typical number of options. """
+
+    cmd = 'options-app'
+
+    def define_program_options(self, params):
+        for i in range(10):
+            params.add_int('int%d' % i, default=i)
+            params.add_string('string%d' % i, default='s%d' % i)
+        params.add_float_list('floats', default=[1.0])
+        params.add_string_choice('mode', ['a', 'b'], default='a')
+
+    def go(self):
+        pass
+
+
+config = dict(int1=10, int2='20', string3='x', floats=[2.0, 3.0], mode='b')
+args = ['--int1', '10', '--int2', '20', '--string3', 'x', 
+        '--floats', '2.0', '3.0', '--mode', 'b']
+
+
+def from_dict():
+    OptionsApp().set_options_from_dict(config)
+
+
+def from_args():
+    OptionsApp().set_options_from_args(args)
+
+
+params = DecentParams()
+OptionsApp().define_program_options(params)
+
+
+def from_dict_same_spec():
+    """ Only interpreting the dict, with a DecentParams already built. """
+    params.get_dpr_from_dict(config)
+
+
+def from_args_new_parser():
+    """ What from_args() cost when the parser was created every time. """
+    app = OptionsApp()
+    params = DecentParams()
+    app.define_program_options(params)
+    params.get_dpr_from_args(args)
+
+
+def throughput(f, n):
+    """ Returns the number of calls of f per second. """
+    t0 = time.time()
+    for _ in range(n):
+        f()
+    return n / max(time.time() - t0, 1e-9)
+
+
+def main(n=2000):
+    # as in QuickApp, unless --contracts is given
+    contracts.disable_all()
+    for name, f in [('dict', from_dict), ('dict, same spec', from_dict_same_spec),
+                    ('args', from_args),
+                    ('args, new parser', from_args_new_parser)]:
+        print('%-20s %8.0f per second' % (name, throughput(f, n)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,7 +1,12 @@
+from .dep_chain import DepChain
+from .job_registry import JobRegistry
 from .resource_manager import ResourceManager
 from .report_manager import ReportManager
 from compmake import Promise, comp, comp_prefix
-from contracts import contract, describe_type
+from compmake.jobs import get_job, set_job
+from compmake.ui.ui import collect_dependencies, generate_job_id
+from .utils.hot_contracts import contract_hot
+from contracts import describe_type
 from types import NoneType
 import os
 import warnings
@@ -12,7 +17,7 @@ __all__ = ['CompmakeContext']
 
 class CompmakeContext(object):
 
-    @contract(extra_dep='list')
+    @contract_hot(extra_dep='list|isinstance(DepChain)')
     def __init__(self, qapp, parent, job_prefix,
                  output_dir, extra_dep=[], resource_manager=None, extra_report_keys=None,
                  report_manager=None):
@@ -22,13 +27,24 @@ class CompmakeContext(object):
         self._job_prefix = job_prefix
         
         if resource_manager is None:
-            resource_manager = ResourceManager(self)
+            graph = None
+            if parent is not None:
+                graph = parent.get_resource_manager().graph
+            resource_manager = ResourceManager(self, graph=graph)
         
         if report_manager is None:
             self.private_report_manager = True  # only create indexe if this is true
             reports = os.path.join(output_dir, 'reports')
             reports_index = os.path.join(output_dir, 'reports.html')
-            report_manager = ReportManager(reports, reports_index)
+            # the names of the index jobs are unique and do not depend 
+            # on where the output is
+            if parent is None:
+                root_dir = output_dir
+            else:
+                root_dir = parent.get_root_context()._output_dir
+            base = os.path.splitext(os.path.relpath(reports_index, root_dir))[0]
+            report_manager = ReportManager(reports, reports_index,
+                                           job_id_base=base)
         else:
             self.private_report_manager = False
         
@@ -36,55 +52,120 @@ class CompmakeContext(object):
         self._resource_manager = resource_manager
         self._output_dir = output_dir
         self.n_comp_invocations = 0
+        if not isinstance(extra_dep, DepChain):
+            extra_dep = DepChain().extend(extra_dep)
+        # shared with the children; replaced, never modified
         self._extra_dep = extra_dep
-        self._jobs = {}
+        # the registry of the jobs is shared by all contexts of the tree
+        if parent is None:
+            registry = JobRegistry()
+            self._jobs = registry.new_view(job_prefix)
+        else:
+            registry = parent._jobs.registry
+            self._jobs = registry.new_view(job_prefix, parent._job_prefix)
+        # job_id -> Promise for the jobs in _jobs that no other job in
+        # _jobs depends on (all the others are ancestors of these)
+        self._frontier = {}
         if extra_report_keys is None:
             extra_report_keys = {}
         self.extra_report_keys = extra_report_keys
+        # node id of the resource being provided in this context, if any
+        self._provided_resource = None
+        if parent is not None:
+            self._provided_resource = parent.get_provided_resource()
+        # if not None, the jobs record their statistics here (see job_stats)
+        self._job_stats_dir = None
+        if parent is not None:
+            self._job_stats_dir = parent._job_stats_dir
         
     def finalize_jobs(self):
         """ After all jobs have been defined, we create index jobs. """
         if self.private_report_manager:
+            # otherwise the ids get the prefix of the last context used
+            comp_prefix(self._job_prefix)
             self.get_report_manager().create_index_job()
         
     def __str__(self):
         return 'CC(%s, %s)' % (type(self._qapp).__name__, self._job_prefix)
     
     def all_jobs(self):
-        return list(self._jobs.values())
+        return self._jobs.promises()
     
     def all_jobs_dict(self):
-        return dict(self._jobs)
+        return self._jobs.as_dict()
+
+    def get_job_prefix(self):
+        """ Returns the prefix of the jobs defined in this context (or None). """
+        return self._job_prefix
+
+    def get_root_context(self):
+        """ Returns the context at the root of the tree. """
+        context = self
+        while context._parent is not None:
+            context = context._parent
+        return context
+
+    def get_job_registry(self):
+        """ Returns the JobRegistry shared by all the contexts of the tree. """
+        return self._jobs.registry
+
+    def merge_jobs(self, other):
+        """ Adds the jobs of another context (e.g. a subtask) to this one. """
+        self._jobs.attach(other._jobs)
+        # This is a superset of the frontier, as the other jobs might depend 
+        # on our frontier; it is only used for checkpoints, so it's fine.
+        self._frontier.update(other._frontier)
     
-    @contract(job_name='str', returns=Promise)
+    @contract_hot(job_name='str', returns=Promise)
     def checkpoint(self, job_name):
         """ 
             Creates a dummy job called "job_name" that depends on all jobs
-            previously defined; further, this new job is put into _extra_dep.
+            previously defined and on the extra dependencies; further, this 
+            new job replaces the extra dependencies of this context.
             This means that all successive jobs will require that the previous 
             ones be done.
             
             Returns the checkpoint job (CompmakePromise).
         """
-        job_checkpoint = self.comp(checkpoint, job_name, prev_jobs=list(self._jobs.values()),
+        # depending on the frontier is enough to depend on all the jobs
+        prev_jobs = list(self._frontier.values())
+        job_checkpoint = self.comp(checkpoint, job_name, prev_jobs=prev_jobs,
                                    job_id=job_name)
-        self._extra_dep.append(job_checkpoint)
+        # the checkpoint depends on all the previous extra dependencies
+        self._extra_dep = DepChain().extend([job_checkpoint])
         return job_checkpoint
     
-    @contract(returns=Promise)
+    @contract_hot(returns=Promise)
     def comp(self, f, *args, **kwargs):
         """ 
             Simple wrapper for Compmake's comp function. 
             Use this instead of "comp". """
         self.count_comp_invocations()
+        command_desc = None
+        if self._job_stats_dir is not None:
+            from .job_stats import measure_job
+            comp_kwargs, job_id = self._split_comp_kwargs(f, kwargs)
+            command_desc = f.__name__
+            args = (self._job_stats_dir, job_id, f, list(args), kwargs)
+            f = measure_job
+            kwargs = comp_kwargs
         comp_prefix(self._job_prefix)
-        extra_dep = self._extra_dep + kwargs.get('extra_dep', [])
+        extra_dep = self._extra_dep.extend(kwargs.get('extra_dep', [])).as_list()
         kwargs['extra_dep'] = extra_dep
         promise = comp(f, *args, **kwargs)
-        self._jobs[promise.job_id] = promise
+        if command_desc is not None:
+            # show the user's function, not the wrapper
+            job = get_job(promise.job_id)
+            job.command_desc = command_desc
+            set_job(promise.job_id, job)
+        self._jobs.register(promise)
+        # the dependencies of this job are not in the frontier anymore
+        for job_id in collect_dependencies([list(args), kwargs]):
+            self._frontier.pop(job_id, None)
+        self._frontier[promise.job_id] = promise
         return promise
     
-    @contract(returns=Promise)
+    @contract_hot(returns=Promise)
     def comp_config(self, f, *args, **kwargs):
         """ 
             Like comp, but we also automatically save the GlobalConfig state.
@@ -94,11 +175,69 @@ class CompmakeContext(object):
         kwargs['command_name'] = f.__name__
         return self.comp(wrap_state, config_state, f, *args, **kwargs)
     
+    def comp_npy(self, f, *args, **kwargs):
+        """ 
+            Like comp, but the NumPy arrays in the result (also inside lists,
+            tuples, dicts) larger than ``npy_threshold`` bytes (default 1MB)
+            are saved as .npy files in the output dir. The DB stores only 
+            a reference, and the jobs using the result get read-only 
+            memory-mapped arrays. Requires NumPy.
+        """
+        from .npy_results import save_npy_result
+        threshold = kwargs.pop('npy_threshold', 1024 * 1024)
+        comp_kwargs, job_id = self._split_comp_kwargs(f, kwargs)
+        dirname = os.path.join(self.get_output_dir(), 'npy')
+        return self.comp(save_npy_result, dirname, job_id, threshold,
+                         f, list(args), kwargs, **comp_kwargs)
+
+    def comp_stream(self, f, *args, **kwargs):
+        """ 
+            Like comp, but f is a generator. The items it yields are saved 
+            in chunks of ``chunk_size`` items (default 1000) in the output 
+            dir as they are produced, so that they don't need to fit in 
+            memory. The jobs using the result get a StreamHandle, which 
+            iterates over the items reading one chunk at a time.
+        """
+        from .streams import save_stream
+        chunk_size = kwargs.pop('chunk_size', 1000)
+        comp_kwargs, job_id = self._split_comp_kwargs(f, kwargs)
+        dirname = os.path.join(self.get_output_dir(), 'streams', job_id)
+        return self.comp(save_stream, dirname, chunk_size,
+                         f, list(args), kwargs, **comp_kwargs)
+
+    def _split_comp_kwargs(self, f, kwargs):
+        """ 
+            Removes from kwargs the arguments for comp (job_id, extra_dep) 
+            and returns them, together with the full id the job will have.
+        """
+        comp_kwargs = {}
+        for k in ['extra_dep', 'job_id']:
+            if k in kwargs:
+                comp_kwargs[k] = kwargs.pop(k)
+        # we need to know the job id in advance
+        if not 'job_id' in comp_kwargs:
+            comp_prefix(self._job_prefix)
+            job_id = generate_job_id(f)
+            if self._job_prefix is not None:
+                job_id = job_id[len(self._job_prefix) + 1:]
+            comp_kwargs['job_id'] = job_id
+        full_job_id = comp_kwargs['job_id']
+        if self._job_prefix is not None:
+            full_job_id = '%s-%s' % (self._job_prefix, full_job_id)
+        return comp_kwargs, full_job_id
+
     def count_comp_invocations(self):
         self.n_comp_invocations += 1
         if self._parent is not None:
             self._parent.count_comp_invocations()
 
+    def set_job_stats_dir(self, dirname):
+        """ 
+            If not None, the jobs defined from now on in this context and 
+            its children record their peak memory in dirname (see job_stats). 
+        """
+        self._job_stats_dir = dirname
+
     def get_output_dir(self):
         """ Returns a suitable output directory for data files """
         # only create output dir on demand
@@ -107,7 +246,7 @@ class CompmakeContext(object):
 
         return self._output_dir
         
-    @contract(extra_dep='list')    
+    @contract_hot(extra_dep='list')    
     def child(self, name, qapp=None, add_job_prefix=None, add_outdir=None, extra_dep=[],
               extra_report_keys=None,
               separate_resource_manager=False,
@@ -167,7 +306,7 @@ class CompmakeContext(object):
         else:
             resource_manager = self._resource_manager
         
-        _extra_dep = self._extra_dep + extra_dep
+        _extra_dep = self._extra_dep.extend(extra_dep)
          
         extra_report_keys_ = {}
         extra_report_keys_.update(self.extra_report_keys)
@@ -183,7 +322,7 @@ class CompmakeContext(object):
                                extra_dep=_extra_dep)
         return c1
 
-    @contract(extra_dep='list')    
+    @contract_hot(extra_dep='list')    
     def subtask(self, task, extra_dep=[], add_job_prefix=None, add_outdir=None,
                     separate_resource_manager=False,
                     separate_report_manager=False,
@@ -199,29 +338,37 @@ class CompmakeContext(object):
                                          separate_resource_manager=separate_resource_manager)
 
     # Resource managers
-    @contract(returns=ResourceManager)
+    @contract_hot(returns=ResourceManager)
     def get_resource_manager(self):
         return self._resource_manager
     
     def needs(self, rtype, **params):
         # print('%s %s %s %s %s' % (id(self), self._qapp, self._job_prefix, rtype, params))
         rm = self.get_resource_manager()
-        res = rm.get_resource(rtype, **params)
+        res = rm.request_resource(self, rtype, params)
         assert isinstance(res, Promise), describe_type(res)
-        self._extra_dep.append(res)
+        self._extra_dep = self._extra_dep.extend([res])
 
     def get_resource(self, rtype, **params):
         rm = self.get_resource_manager()
-        return rm.get_resource(rtype, **params)
+        return rm.request_resource(self, rtype, params)
+
+    def set_provided_resource(self, node):
+        """ Marks this context as the one providing the given resource. """
+        self._provided_resource = node
+
+    def get_provided_resource(self):
+        """ Returns the resource provided in this context (or a parent), or None. """
+        return self._provided_resource
     
     # Reports    
-    @contract(report=Promise, report_type='str')
+    @contract_hot(report=Promise, report_type='str')
     def add_report(self, report, report_type, **params):
         rm = self.get_report_manager()
         params.update(self.extra_report_keys)
         rm.add(report, report_type, **params)
 
-    @contract(returns=Promise, report_type='str')
+    @contract_hot(returns=Promise, report_type='str')
     def get_report(self, report_type, **params):
         """ Returns the promise to the given report """
         rm = self.get_report_manager()
@@ -0,0 +1,105 @@
+from contracts import contract
+import bz2
+import time
+import zlib
+
+__all__ = ['Codec', 'codec_names']
+
+
+def _lz4():
+    """ Returns the lz4 block module, if the optional package is installed. """
+    try:
+        import lz4.block as lz4_block  # @UnresolvedImport
+    except ImportError:
+        try:
+            import lz4 as lz4_block  # @UnresolvedImport
+        except ImportError:
+            return None
+    return lz4_block
+
+codec_names = ['none', 'zlib', 'bz2', 'lz4']
+
+# one-byte header of the encoded data, so that it can always be decoded
+_headers = {'none': 'n', 'zlib': 'z', 'bz2': 'b', 'lz4': 'l'}
+
+
+class Codec(object):
+    """
+        Compresses the serialized job results.
+
+        Data smaller than ``threshold`` bytes is stored uncompressed.
+        The encoded data starts with a byte identifying the codec,
+        so data written with any codec can be decoded.
+
+        Keeps the statistics of bytes saved and time spent.
+    """
+
+    @contract(name='str', level='int,>=0,<=9', threshold='int,>=0')
+    def __init__(self, name, level=6, threshold=0):
+        if not name in codec_names:
+            msg = 'Unknown codec %r; available: %s' % (name, codec_names)
+            raise ValueError(msg)
+        if name == 'lz4' and _lz4() is None:
+            msg = 'The codec "lz4" needs the package lz4 to be installed.'
+            raise ValueError(msg)
+        self.name = name
+        self.level = level
+        self.threshold = threshold
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.seconds = 0.0
+        self.seconds_decode = 0.0
+
+    def __repr__(self):
+        return 'Codec(%r, level=%d, threshold=%d)' % (self.name, self.level,
+                                                     self.threshold)
+
+    def encode(self, s):
+        """ Returns the encoded string. """
+        t0 = time.time()
+        name = self.name
+        if len(s) < self.threshold:
+            name = 'none'
+        if name == 'none':
+            data = s
+        elif name == 'zlib':
+            data = zlib.compress(s, self.level)
+        elif name == 'bz2':
+            data = bz2.compress(s, max(1, self.level))
+        elif name == 'lz4':
+            data = _lz4().compress(s)
+        encoded = _headers[name] + data
+        self.seconds += time.time() - t0
+        self.raw_bytes += len(s)
+        self.stored_bytes += len(encoded)
+        return encoded
+
+    def decode(self, encoded):
+        """ Decodes a string returned by encode(). """
+        t0 = time.time()
+        header, data = encoded[:1], encoded[1:]
+        if header == 'n':
+            s = data
+        elif header == 'z':
+            s = zlib.decompress(data)
+        elif header == 'b':
+            s = bz2.decompress(data)
+        elif header == 'l':
+            lz4_block = _lz4()
+            if lz4_block is None:
+                msg = 'Data compressed with lz4, but lz4 is not installed.'
+                raise ValueError(msg)
+            s = lz4_block.decompress(data)
+        else:
+            raise ValueError('Unknown codec header %r.' % header)
+        self.seconds_decode += time.time() - t0
+        return s
+
+    def stats(self):
+        """ Returns a string describing the bytes saved and time spent. """
+        saved = self.raw_bytes - self.stored_bytes
+        ratio = 100.0 * saved / self.raw_bytes if self.raw_bytes else 0.0
+        return ('codec %s: %d bytes -> %d bytes (%.1f%% saved) in %.2f s; '
+                '%.2f s decoding' % (self.name, self.raw_bytes, 
+                                     self.stored_bytes, ratio, self.seconds,
+                                     self.seconds_decode))
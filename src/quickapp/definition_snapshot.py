@@ -0,0 +1,142 @@
+from compmake.jobs import job_exists
+from conf_tools import GlobalConfig
+from contracts import contract
+from distutils.sysconfig import get_python_lib
+import cPickle as pickle
+import hashlib
+import os
+import site
+import sys
+
+__all__ = ['definition_fingerprint', 'save_definition_snapshot',
+           'load_definition_snapshot']
+
+# options that do not change the jobs that are defined
+options_not_affecting_jobs = ['command', 'console', 'profile', 'contracts',
+                              'no_definition_cache', 'definition_snapshot',
+                              'codec_level', 'codec_threshold', 'options_file']
+
+
+def definition_fingerprint(qapp, options):
+    """
+        Returns a hash of the inputs of the definition, other than the
+        sources: the values of the options, the configuration directories
+        and the inputs declared by the app (see 
+        QuickApp.get_definition_inputs()).
+        
+        The sources are checked separately (see save_definition_snapshot()).
+    """
+    h = hashlib.sha1()
+    values = options.get_values()
+    for k in sorted(values):
+        if not k in options_not_affecting_jobs:
+            h.update('%s=%r\n' % (k, values[k]))
+    h.update('extra=%r\n' % (options.get_extra(),))
+
+    dirs = list(GlobalConfig._dirs) + list(qapp.get_definition_inputs())
+    for filename in sorted(files_in(dirs)):
+        st = os.stat(filename)
+        h.update('%s %s %s\n' % (filename, st.st_mtime, st.st_size))
+    return h.hexdigest()
+
+
+def files_in(paths):
+    """ Returns the files given, and the files in the directories given. """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for fn in filenames:
+                    yield os.path.join(root, fn)
+        elif os.path.exists(path):
+            yield path
+
+
+def stdlib_dirs():
+    """ 
+        Returns (stdlib, site): the directory of the standard library
+        and the directories of the installed packages (which might be
+        inside the former). 
+    """
+    stdlib = os.path.realpath(get_python_lib(standard_lib=True))
+    site_dirs = set([get_python_lib(), get_python_lib(plat_specific=True)])
+    if hasattr(site, 'getsitepackages'):
+        site_dirs.update(site.getsitepackages())
+    return stdlib, [os.path.realpath(d) for d in site_dirs]
+
+
+def loaded_source_files():
+    """
+        Returns the source files of all the modules loaded,
+        except those of the standard library.
+    """
+    stdlib, site_dirs = stdlib_dirs()
+    files = set()
+    for module in sys.modules.values():
+        filename = getattr(module, '__file__', None)
+        if filename is None:
+            continue
+        if filename.endswith('.pyc') or filename.endswith('.pyo'):
+            filename = filename[:-1]
+        if not os.path.exists(filename):
+            continue
+        filename = os.path.realpath(filename)
+        if (filename.startswith(stdlib) and 
+            not any(filename.startswith(d) for d in site_dirs)):
+            continue
+        files.add(filename)
+    return files
+
+
+def hash_files(filenames):
+    """ Returns a dict filename -> sha1 of the contents (None if missing). """
+    res = {}
+    for filename in filenames:
+        try:
+            with open(filename, 'rb') as f:
+                res[filename] = hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            res[filename] = None
+    return res
+
+
+@contract(filename='str', fingerprint='str', job_ids='list(str)|set(str)')
+def save_definition_snapshot(filename, fingerprint, job_ids):
+    """ 
+        Saves the ids of the jobs defined, with the fingerprint and the 
+        hashes of the sources of all the modules loaded (this must be 
+        called after the definition, so that the modules imported while 
+        defining the jobs are included).
+    """
+    sources = hash_files(loaded_source_files())
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(dict(fingerprint=fingerprint, job_ids=sorted(job_ids),
+                         sources=sources),
+                    f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, filename)
+
+
+@contract(filename='str', fingerprint='str', returns='None|set(str)')
+def load_definition_snapshot(filename, fingerprint):
+    """
+        Returns the set of job ids saved in the snapshot, if the
+        fingerprint matches, the sources did not change and all the 
+        jobs are still in the DB; otherwise None.
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        return None
+    if snapshot.get('fingerprint', None) != fingerprint:
+        return None
+    sources = snapshot.get('sources', None)
+    if sources is None or hash_files(sources) != sources:
+        return None
+    job_ids = snapshot['job_ids']
+    for job_id in job_ids:
+        if not job_exists(job_id):
+            return None
+    return set(job_ids)
@@ -0,0 +1,91 @@
+from compmake import Promise
+from contracts import contract
+
+__all__ = ['DepChain']
+
+
+class DepChain(object):
+    """
+        An immutable chain of extra dependencies (Promises).
+
+        Each chain shares the tail with the chain from which it was
+        extended, so that creating a child context does not copy the
+        dependencies: a node keeps only the Promises it adds (and their
+        ids), so a chain of n Promises uses O(n) memory. 
+        A Promise is added only once to a chain.
+    """
+
+    __slots__ = ['_parent', '_deps', '_ids', '_len', '_list']
+
+    def __init__(self, parent=None, deps=()):
+        self._parent = parent
+        # Promises added by this node (not in the parent), and their ids;
+        # the ids of the whole chain are never copied in a node
+        self._deps = tuple(deps)
+        self._ids = frozenset(d.job_id for d in self._deps)
+        self._len = len(self._deps)
+        if parent is not None:
+            self._len += len(parent)
+        # memoized list of all Promises
+        self._list = None
+
+    @contract(deps='seq')
+    def extend(self, deps):
+        """
+            Returns a chain with the given dependencies added;
+            returns self if they are all already present.
+        """
+        if not deps:
+            return self
+        new = []
+        new_ids = set()
+        for d in deps:
+            if not isinstance(d, Promise):
+                msg = 'Expected a Promise as dependency, got %r.' % d
+                raise ValueError(msg)
+            if d.job_id in new_ids or self.contains(d.job_id):
+                continue
+            new.append(d)
+            new_ids.add(d.job_id)
+        if not new:
+            return self
+        return DepChain(self, new)
+
+    def contains(self, job_id):
+        """ Returns True if the job is in the chain. """
+        node = self
+        while node is not None:
+            if job_id in node._ids:
+                return True
+            node = node._parent
+        return False
+
+    def job_ids(self):
+        """ Returns the set of job ids in the chain (computed each time). """
+        ids = set()
+        node = self
+        while node is not None:
+            ids.update(node._ids)
+            node = node._parent
+        return frozenset(ids)
+
+    def as_list(self):
+        """
+            Returns the list of Promises. The list is computed once and
+            shared, so it must not be modified.
+        """
+        if self._list is None:
+            # without memoizing the lists of the ancestors
+            nodes = []
+            node = self
+            while node is not None:
+                nodes.append(node)
+                node = node._parent
+            self._list = [d for node in reversed(nodes) for d in node._deps]
+        return self._list
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return 'DepChain(%s)' % ', '.join(d.job_id for d in self.as_list())
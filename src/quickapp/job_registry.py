@@ -0,0 +1,103 @@
+from compmake import Promise
+from contracts import contract
+
+__all__ = ['JobRegistry', 'JobView']
+
+
+class JobRegistry(object):
+    """
+        The jobs defined by all the contexts of an app; there is one
+        registry per root context, shared by all its children.
+
+        Each job is registered once; the contexts see their jobs through
+        a JobView.
+    """
+
+    def __init__(self):
+        # job_id -> Promise
+        self.jobs = {}
+        # job_id -> job prefix of the context that defined it
+        self.prefixes = {}
+        # job prefix -> job prefix of the parent context (None is the root)
+        self.parent_prefix = {}
+
+    def new_view(self, prefix=None, parent_prefix=None):
+        """ 
+            Returns a new (empty) view of this registry, for a context 
+            with the given job prefix, child of one with parent_prefix. 
+        """
+        if prefix != parent_prefix and not prefix in self.parent_prefix:
+            self.parent_prefix[prefix] = parent_prefix
+        return JobView(self, prefix)
+
+    def prefix_ancestors(self, prefix):
+        """ Returns the list of prefixes from prefix up to the root (None). """
+        res = [prefix]
+        while prefix is not None:
+            prefix = self.parent_prefix.get(prefix, None)
+            res.append(prefix)
+        return res
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+class JobView(object):
+    """
+        The jobs of one context: the ones defined directly in it plus the
+        ones of the views attached to it (e.g. the subtasks).
+
+        Attaching a view is O(1): the jobs are not copied.
+    """
+
+    __slots__ = ['registry', 'prefix', '_own', '_attached']
+
+    @contract(registry=JobRegistry, prefix='None|str')
+    def __init__(self, registry, prefix=None):
+        self.registry = registry
+        self.prefix = prefix
+        # job ids of the jobs defined in this context
+        self._own = []
+        # other views whose jobs are also ours
+        self._attached = []
+
+    @contract(promise=Promise)
+    def register(self, promise):
+        """ Registers a job defined in this context. """
+        self.registry.jobs[promise.job_id] = promise
+        self.registry.prefixes[promise.job_id] = self.prefix
+        self._own.append(promise.job_id)
+
+    def attach(self, view):
+        """ Adds the jobs of another view (of the same registry) to this one. """
+        if view.registry is not self.registry:
+            msg = 'Cannot attach a view of a different registry.'
+            raise ValueError(msg)
+        if view is not self:
+            self._attached.append(view)
+
+    def job_ids(self):
+        """ Iterates over the ids of the jobs in this view. """
+        seen_views = set()
+        seen = set()
+        stack = [self]
+        while stack:
+            view = stack.pop()
+            if id(view) in seen_views:
+                continue
+            seen_views.add(id(view))
+            for job_id in view._own:
+                if not job_id in seen:
+                    seen.add(job_id)
+                    yield job_id
+            stack.extend(reversed(view._attached))
+
+    def promises(self):
+        """ Returns the list of Promises of the jobs in this view. """
+        jobs = self.registry.jobs
+        return [jobs[job_id] for job_id in self.job_ids()]
+
+    def as_dict(self):
+        """ Returns a dict job_id -> Promise for the jobs in this view. """
+        jobs = self.registry.jobs
+        return dict((job_id, jobs[job_id]) for job_id in self.job_ids())
@@ -0,0 +1,210 @@
+"""
+    Accounting of the resources used by the jobs, aggregated along the
+    hierarchy of the contexts (by job prefix).
+
+    For each job we collect the wall and CPU time (from the compmake
+    cache), the size of the stored result, and the increase of the
+    peak RSS while the job was running; the latter is recorded by the
+    job itself, if it was defined with measure_job(), in a file in
+    the stats directory (not in the compmake DB).
+
+    The values that are not known (e.g. the memory of the jobs done
+    before --stats was used) are None, and are shown as missing.
+"""
+from compmake.jobs import get_job_cache
+from compmake.jobs.storage import job2userobjectkey
+from compmake.state import get_compmake_db
+from contracts import contract
+import cPickle as pickle
+import json
+import os
+import resource
+import sys
+import time
+
+__all__ = ['measure_job', 'collect_job_stats', 'aggregate_job_stats',
+           'write_job_stats']
+
+# name of the root context in the summaries
+ROOT = '(root)'
+
+# tolerance (seconds) when checking that a measurement is of the last run
+_slack = 1.0
+
+
+def measurement_filename(stats_dir, job_id):
+    """ Returns the file where the job records its measurements. """
+    return os.path.join(stats_dir, 'jobs', '%s.pickle' % job_id)
+
+
+def peak_rss_mb():
+    """ Returns the peak RSS of this process, in MB. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024)
+    return peak / 1024.0
+
+
+def measure_job(stats_dir, job_name, f, args, kwargs):
+    """
+        Calls f and records in stats_dir how much the peak RSS of the
+        process increased meanwhile. Returns the result of f.
+
+        This is a lower bound of the memory used by the job, as the peak
+        could have been reached before, by another job.
+    """
+    rss0 = peak_rss_mb()
+    result = f(*args, **kwargs)
+    record = dict(rss_delta=peak_rss_mb() - rss0, time=time.time())
+    filename = measurement_filename(stats_dir, job_name)
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # created by another job meanwhile
+            pass
+    tmp = '%s.tmp%s' % (filename, os.getpid())
+    with open(tmp, 'wb') as fo:
+        pickle.dump(record, fo, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, filename)
+    return result
+
+
+def read_measurement(stats_dir, job_id, cache):
+    """
+        Returns the RSS increase recorded by the last execution of the
+        job, or None. A record written by a previous execution (the job
+        was cleaned and done again without being measured) is deleted.
+    """
+    filename = measurement_filename(stats_dir, job_id)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        record = pickle.load(f)
+    if not (cache.time_start - _slack <= record['time']
+            <= cache.timestamp + _slack):
+        os.unlink(filename)
+        return None
+    return record['rss_delta']
+
+
+def stored_size(db, key):
+    """ Returns the number of bytes used by db to store key. """
+    # the caches in front of a DB
+    while hasattr(db, 'db') and not hasattr(db, 'filename_for_key'):
+        db = db.db
+    if hasattr(db, 'filename_for_key'):
+        return os.path.getsize(db.filename_for_key(key))
+    if hasattr(db, '_connection'):
+        cur = db._connection().execute('SELECT length(value) FROM compmake '
+                                       'WHERE key=?', (key,))
+        return cur.fetchone()[0]
+    return len(pickle.dumps(db[key], pickle.HIGHEST_PROTOCOL))
+
+
+@contract(stats_dir='str')
+def collect_job_stats(registry, stats_dir):
+    """
+        Returns a list of dicts, one for each job of the registry
+        that was done, with fields job_id, prefix, walltime, cputime,
+        result_bytes and rss_delta (each None if not known).
+    """
+    db = get_compmake_db()
+    res = []
+    for job_id in sorted(registry.jobs):
+        cache = get_job_cache(job_id)
+        if cache.walltime_used is None:
+            continue
+        key = job2userobjectkey(job_id)
+        result_bytes = stored_size(db, key) if key in db else None
+        cputime = cache.cputime_used
+        if cputime is not None:
+            cputime = float(cputime)
+        res.append(dict(job_id=job_id, prefix=registry.prefixes[job_id],
+                        walltime=float(cache.walltime_used),
+                        cputime=cputime, result_bytes=result_bytes,
+                        rss_delta=read_measurement(stats_dir, job_id, cache)))
+    return res
+
+
+def aggregate_job_stats(registry, jobs):
+    """
+        Aggregates the statistics of the jobs (as returned by
+        collect_job_stats()) for each context and all its ancestors.
+
+        Returns a dict prefix -> dict(jobs, walltime, cputime,
+        result_bytes, rss_delta, missing); the times and bytes are summed,
+        rss_delta is the maximum; ``missing`` is the number of jobs for
+        which some value is not known (the aggregates do not include them).
+        The root context is called ROOT.
+    """
+    fields = ['walltime', 'cputime', 'result_bytes', 'rss_delta']
+    totals = {}
+    for job in jobs:
+        missing = any(job[k] is None for k in fields)
+        for prefix in registry.prefix_ancestors(job['prefix']):
+            if prefix is None:
+                prefix = ROOT
+            if not prefix in totals:
+                totals[prefix] = dict(jobs=0, walltime=0.0, cputime=0.0,
+                                      result_bytes=0, rss_delta=None,
+                                      missing=0)
+            t = totals[prefix]
+            t['jobs'] += 1
+            t['missing'] += 1 if missing else 0
+            for k in ['walltime', 'cputime', 'result_bytes']:
+                if job[k] is not None:
+                    t[k] += job[k]
+            rss = [x for x in [t['rss_delta'], job['rss_delta']]
+                   if x is not None]
+            if rss:
+                t['rss_delta'] = max(rss)
+    return totals
+
+
+@contract(dirname='str')
+def write_job_stats(dirname, jobs, totals):
+    """
+        Writes stats.json and stats.html in dirname; returns the
+        filename of the latter.
+    """
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(os.path.join(dirname, 'stats.json'), 'w') as f:
+        json.dump(dict(contexts=totals, jobs=jobs), f, indent=1, sort_keys=True)
+
+    def fmt(x, f):
+        return 'n/a' if x is None else f % x
+
+    def table(f, title, rows):
+        f.write('<h2>%s</h2>\n' % title)
+        f.write('<table border="1">\n<tr><th>%s</th><th>jobs</th>'
+                '<th>wall (s)</th><th>cpu (s)</th><th>result (bytes)</th>'
+                '<th>peak RSS increase (MB)</th><th>jobs not measured</th>'
+                '</tr>\n' % title.split()[-1])
+        for name, r in rows:
+            f.write('<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td>'
+                    '<td>%s</td><td>%s</td><td>%s</td></tr>\n' %
+                    (name, r.get('jobs', 1), fmt(r['walltime'], '%.2f'),
+                     fmt(r['cputime'], '%.2f'), fmt(r['result_bytes'], '%d'),
+                     fmt(r['rss_delta'], '%.1f'), r.get('missing', '')))
+        f.write('</table>\n')
+
+    def cputime(r):
+        return r['cputime'] or 0
+
+    html = os.path.join(dirname, 'stats.html')
+    with open(html, 'w') as f:
+        f.write('<html><body>\n')
+        f.write('<p>"n/a": not measured (e.g. the job was done before '
+                'the statistics were enabled).</p>\n')
+        # most expensive first
+        rows = sorted(totals.items(), key=lambda x: (-cputime(x[1]), x[0]))
+        table(f, 'Statistics by context', rows)
+        rows = [(j['job_id'], j) for j in
+                sorted(jobs, key=lambda x: (-cputime(x), x['job_id']))]
+        table(f, 'Statistics by job', rows)
+        f.write('</body></html>\n')
+    return html
@@ -0,0 +1,84 @@
+"""
+    Job results in which the large NumPy arrays are stored in .npy files,
+    instead of being pickled in the compmake DB.
+
+    The arrays are returned as NpyArray: memory-mapped, read-only arrays
+    which are pickled as a reference to their file, so that the consumers
+    of the result map the file instead of unpickling a copy.
+"""
+from contracts import contract
+import numpy as np
+import os
+
+__all__ = ['NpyArray', 'load_npy', 'save_npy_result']
+
+
+class NpyArray(np.ndarray):
+    """
+        A read-only array mapped from a .npy file. It is pickled as a
+        reference to the file; the arrays derived from it (views,
+        results of operations) are pickled normally.
+    """
+
+    def __array_finalize__(self, obj):
+        self.npy_filename = None
+
+    def __reduce__(self):
+        if self.npy_filename is not None:
+            return (load_npy, (self.npy_filename,))
+        return np.asarray(self).__reduce__()
+
+
+@contract(filename='str')
+def load_npy(filename):
+    """ Returns an NpyArray mapping the given .npy file. """
+    a = np.load(filename, mmap_mode='r').view(NpyArray)
+    a.npy_filename = filename
+    return a
+
+
+def write_npy(filename, a):
+    """ Writes the array to the .npy file atomically. """
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp = '%s.tmp%s' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, a)
+    os.rename(tmp, filename)
+
+
+def replace_large_arrays(ob, basename, threshold, counter):
+    """
+        Returns ob with the arrays of at least threshold bytes (also inside
+        lists, tuples and dicts) replaced by NpyArrays.
+    """
+    if isinstance(ob, NpyArray) and ob.npy_filename is not None:
+        return ob
+    if isinstance(ob, np.ndarray) and ob.dtype != object:
+        if ob.nbytes < threshold:
+            return ob
+        filename = '%s-%d.npy' % (basename, len(counter))
+        counter.append(filename)
+        write_npy(filename, ob)
+        return load_npy(filename)
+    if isinstance(ob, list):
+        return [replace_large_arrays(x, basename, threshold, counter)
+                for x in ob]
+    if isinstance(ob, tuple):
+        return tuple(replace_large_arrays(x, basename, threshold, counter)
+                     for x in ob)
+    if isinstance(ob, dict):
+        return dict((k, replace_large_arrays(v, basename, threshold, counter))
+                    for k, v in ob.items())
+    return ob
+
+
+def save_npy_result(dirname, basename, threshold, f, args, kwargs):
+    """ 
+        Calls f and stores the large arrays of the result in dirname,
+        in files named <basename>-<i>.npy. 
+    """
+    result = f(*args, **kwargs)
+    return replace_large_arrays(result, os.path.join(dirname, basename),
+                                threshold, [])
@@ -1,10 +1,21 @@
 from .compmake_context import CompmakeContext
+from .compression import Codec, codec_names
+from .definition_snapshot import (definition_fingerprint, 
+    load_definition_snapshot, save_definition_snapshot)
 from .exceptions import QuickAppException
-from .quick_app_base import QuickAppBase
+from .job_stats import (collect_job_stats, aggregate_job_stats, 
+    write_job_stats, ROOT)
+from .quick_app_base import QuickAppBase, unwrap_arg
+from .report_manager import ReportManager
+from .resource_graph import ResourceGraph
+from .resource_manager import ResourceManager
+from .storage import get_storage, storage_types, WriteBackCache
+from .utils.hot_contracts import strip_hot_contracts, restore_hot_contracts
 from abc import abstractmethod
 from compmake import (batch_command, compmake_console, read_rc_files, comp_prefix,
-    get_comp_prefix, set_compmake_db)
-from compmake.storage.filesystem import StorageFilesystem
+    get_comp_prefix, set_compmake_db, CompmakeGlobalState)
+from compmake.ui.ui import (consider_jobs_as_defined_now, 
+    reset_jobs_definition_set)
 from conf_tools.utils import indent
 from contracts import ContractsMeta, contract
 from decent_params.utils import wrap_script_entry_point, UserError
@@ -38,6 +49,14 @@ class QuickApp(QuickAppBase):
         pass
 
 
+    def get_definition_inputs(self):
+        """ 
+            Returns the files and directories read while defining the jobs 
+            (other than the sources and the configuration), so that the 
+            jobs are defined again when they change (see --definition_snapshot). 
+        """
+        return []
+
     # Implementation
              
     def _define_options_compmake(self, params):
@@ -55,14 +74,60 @@ class QuickApp(QuickAppBase):
     
         params.add_flag('console', help='Use Compmake console', group=g)
 
+        params.add_string('options_file', default=None,
+                          help='File (JSON, YAML or INI) with the values of the '
+                               'options; the command line takes precedence',
+                          group=g)
+
         params.add_string('command', short='c',
                       help="Command to pass to compmake for batch mode",
                       default='make', group=g)
+
+        params.add_string_choice('storage', sorted(storage_types),
+                                 help='Type of storage for the compmake DB: ' + 
+                                 '; '.join('%s: %s' % (k, storage_types[k]) 
+                                           for k in sorted(storage_types)),
+                                 default='filesystem', group=g)
+
+        params.add_string_choice('codec', ['default'] + codec_names,
+                                 help='Compression of the compmake DB; "default" '
+                                      'is gzip for the filesystem, none for sqlite',
+                                 default='default', group=g)
+        params.add_int('codec_level', help='Compression level (0-9) of the codec',
+                       default=6, group=g)
+        params.add_int('codec_threshold',
+                       help='Objects smaller than this (bytes) are not compressed',
+                       default=1024, group=g)
+
+        params.add_flag('no_definition_cache',
+                        help='Do not cache the compmake DB in memory while '
+                             'defining the jobs', group=g)
+
+        params.add_flag('definition_snapshot',
+                        help='Reuse the jobs defined in the last run if the '
+                             'options, the sources of the modules loaded and '
+                             'the declared inputs did not change', 
+                        group=g)
+
+        params.add_flag('resources_graph',
+                        help='Write the graph of resources (and its critical path) '
+                             'in <output>/resources/', group=g)
+
+        params.add_flag('stats',
+                        help='Write the time, result size and memory used by the '
+                             'jobs, by context, in <output>/stats/', group=g)
     
     def define_program_options(self, params):
         self._define_options_compmake(params)
         self.define_options(params)
     
+    def get_options_cache_dir(self, namespace):
+        """ The values of the options file are cached in the output dir. """
+        output = unwrap_arg(getattr(namespace, 'output', None))
+        if not output:
+            return None
+        return os.path.join(output, 'options-cache')
+
     def get_qapp_parent(self):
         parent = self.parent
         while parent is not None:
@@ -102,6 +167,7 @@ class QuickApp(QuickAppBase):
                 msg = 'PyContracts disabled for speed. Use --contracts to activate.'
                 self.logger.warning(msg)
                 contracts.disable_all()
+            set_definition_contracts(options.contracts)
 
         warnings.warn('removed configuration below')  # (start)
 
@@ -109,10 +175,16 @@ class QuickApp(QuickAppBase):
         
         # Compmake storage for results        
         storage = os.path.join(output_dir, 'compmake')
-        sf = StorageFilesystem(storage, compress=True)
-#     sf = StorageFilesystem2(directory)
-#     sf = MemoryCache(sf)
+        if options.codec == 'default':
+            codec = None
+        else:
+            codec = Codec(options.codec, level=options.codec_level,
+                          threshold=options.codec_threshold)
+        sf = get_storage(options.storage, storage, codec=codec)
         set_compmake_db(sf)
+        # the jobs defined before in this process (e.g. by another app) 
+        # are in another DB; the names can be used again
+        reset_jobs_definition_set()
 
         # use_filesystem(storage)
         read_rc_files()
@@ -120,19 +192,64 @@ class QuickApp(QuickAppBase):
         context = CompmakeContext(parent=None, qapp=self, job_prefix=None,
                                   output_dir=output_dir)
         self.context = context
-        original = get_comp_prefix()
-        self.define_jobs_context(context)
-        comp_prefix(original) 
-        
-        context.finalize_jobs()
+        if options.resources_graph:
+            context.get_resource_manager().set_graph(ResourceGraph())
+        stats_dir = os.path.join(output_dir, 'stats')
+        if options.stats:
+            context.set_job_stats_dir(stats_dir)
+            context.get_report_manager().add_link('Statistics of the jobs',
+                                    os.path.join(stats_dir, 'stats.html'))
+
+        # the jobs defined in the last run can be reused if nothing changed 
+        snapshot = os.path.join(output_dir, 'definition-snapshot.pickle')
+        use_snapshot = (options.definition_snapshot and 
+                        not (options.resources_graph or options.stats))
+        job_ids = None
+        if use_snapshot:
+            fingerprint = definition_fingerprint(self, options)
+            job_ids = load_definition_snapshot(snapshot, fingerprint)
+
+        if job_ids is not None:
+            self.info('Definition unchanged; reusing the %d jobs defined before.' 
+                      % len(job_ids))
+            consider_jobs_as_defined_now(job_ids)
+        else:
+            before = set(CompmakeGlobalState.jobs_defined_in_this_session)
+            self.define_jobs_and_flush(context, options, sf)
+            job_ids = CompmakeGlobalState.jobs_defined_in_this_session - before
+            if use_snapshot and context.n_comp_invocations > 0:
+                save_definition_snapshot(snapshot, fingerprint, job_ids)
+
+        graph = context.get_resource_manager().graph
+        graph_dir = os.path.join(output_dir, 'resources')
+        if options.resources_graph:
+            graph.write(graph_dir)
         
-        if context.n_comp_invocations == 0:
+        if not job_ids:
             # self.comp was never called
             msg = 'No jobs defined.'
             raise ValueError(msg)
         else: 
             if not options.console:
                 batch_result = batch_command(options.command)
+                if codec is not None:
+                    self.info('Compression in this process: %s' % codec.stats())
+                if options.resources_graph:
+                    graph.write(graph_dir, durations=graph.get_durations())
+                if options.stats:
+                    registry = context.get_job_registry()
+                    jobs = collect_job_stats(registry, stats_dir)
+                    totals = aggregate_job_stats(registry, jobs)
+                    html = write_job_stats(stats_dir, jobs, totals)
+                    self.info('Statistics of the jobs written to %s' % html)
+                    missing = totals.get(ROOT, {}).get('missing', 0)
+                    if missing:
+                        msg = ('%d jobs were not measured, probably because '
+                               'they were done before --stats was used; '
+                               'clean them to measure them.' % missing)
+                        self.logger.warning(msg)
+                    # the index job might have been done before --stats
+                    context.get_report_manager().write_index_now()
                 if isinstance(batch_result, str):
                     ret = QUICKAPP_COMPUTATION_ERROR
                 elif isinstance(batch_result, int):
@@ -148,6 +265,29 @@ class QuickApp(QuickAppBase):
                 compmake_console()
                 return 0
 
+    def define_jobs_and_flush(self, context, options, db):
+        """ 
+            Defines the jobs and creates the index jobs; the DB is cached 
+            in memory meanwhile, unless --no_definition_cache is given. 
+        """
+        if not options.no_definition_cache:
+            cache = WriteBackCache(db)
+            set_compmake_db(cache)
+        original = get_comp_prefix()
+        try:
+            self.define_jobs_context(context)
+            comp_prefix(original) 
+        
+            context.finalize_jobs()
+        finally:
+            try:
+                # also the jobs defined before an error are written
+                if not options.no_definition_cache:
+                    cache.flush()
+                    self.logger.debug('Definition cache: %s' % cache.stats())
+            finally:
+                set_compmake_db(db)
+
     @contract(args='dict(str:*)|list(str)', extra_dep='list')
     def call_recursive(self, context, child_name, cmd_class, args,
                        extra_dep=[],
@@ -186,7 +326,7 @@ class QuickApp(QuickAppBase):
                 child_context.finalize_jobs()
                 
             # Add his jobs to our list of jobs
-            context._jobs.update(child_context.all_jobs_dict()) 
+            context.merge_jobs(child_context)
             return res
         
         except Exception as e:
@@ -222,3 +362,17 @@ def quickapp_main(quickapp_class, args=None, sys_exit=True):
                             args=args, sys_exit=sys_exit)
 
 
+
+
+def set_definition_contracts(enabled):
+    """
+        If enabled is False, removes the contracts wrappers from the methods
+        that are called for each job definition (CompmakeContext, the
+        managers, the subcontexts helpers), so that they have no overhead.
+        If True, the wrappers are put back.
+    """
+    from .app_utils import subcontexts
+    restore_hot_contracts()
+    if not enabled:
+        strip_hot_contracts(CompmakeContext, ResourceManager, ReportManager,
+                            ResourceGraph, subcontexts)
@@ -1,10 +1,12 @@
 from abc import abstractmethod
 from conf_tools.utils import indent
 from contracts import contract, describe_value, ContractsMeta
-from decent_params import DecentParams, UserError
+from decent_params import (DecentParams, UserError, config_from_env, 
+    read_config_file)
 from pprint import pformat
 from .utils import HasLogger
 from quickapp import logger
+import argparse
 import logging
 import os
 import sys
@@ -14,6 +16,9 @@ from decent_params.exceptions import DecentParamsUserError
 
 __all__ = ['QuickAppBase']
 
+# class -> (key, parser): the last parser created for each class  
+_parsers = {}
+
 
 class QuickAppBase(HasLogger):
     """
@@ -22,10 +27,14 @@ class QuickAppBase(HasLogger):
             cmd
             usage
             description (deprecated) => use docstring
+            env_prefix: if not None, the option "name" can also be given 
+                        in the environment variable <env_prefix><NAME>
             
     
     """
     __metaclass__ = ContractsMeta
+    
+    env_prefix = None
 
     def __init__(self, parent=None):
         HasLogger.__init__(self)
@@ -112,6 +121,51 @@ class QuickAppBase(HasLogger):
             return cls.__dict__['cmd']
     
     
+    @classmethod
+    def get_parser(cls, params, prog, usage, description, epilog):
+        """ 
+            Returns the parser for the given spec. Creating the parser
+            is expensive, so the last one created for this class is reused 
+            if the spec and the other arguments did not change.
+        """
+        key = (params.signature(), prog, usage, description, epilog)
+        cached = _parsers.get(cls, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        parser = params.create_parser(prog=prog, usage=usage, epilog=epilog,
+                                      description=description)
+        _parsers[cls] = (key, parser)
+        return parser
+    
+    def get_option_values(self, params, parser, args):
+        """ 
+            Returns the values of the options given in the environment 
+            (see env_prefix) and in the file given with the option 
+            "options_file", if the app has one. The precedence is:
+            defaults < file < environment < command line (args).
+        """
+        values = {}
+        if self.env_prefix is not None:
+            values.update(config_from_env(params, self.env_prefix))
+        if 'options_file' in params.params:
+            # we need to know the file before parsing 
+            ns, _ = parser.parse_known_args(args, argparse.Namespace(**values))
+            filename = unwrap_arg(ns.options_file)
+            if filename:
+                cache_dir = self.get_options_cache_dir(ns)
+                file_values = read_config_file(params, filename, cache_dir)
+                file_values.update(values)
+                values = file_values
+        return values
+    
+    def get_options_cache_dir(self, namespace):
+        """ 
+            Returns the directory where the values read from the options 
+            file are cached, or None; namespace has the values of the
+            options (not interpreted) as given in the command line. 
+        """
+        return None
+    
     def get_options(self):
         return self.options
 
@@ -194,9 +248,13 @@ class QuickAppBase(HasLogger):
 
             desc = cls.get_program_description()
             epilog = cls.get_epilog()
+            parser = cls.get_parser(params, prog=prog, usage=usage,
+                                    description=desc, epilog=epilog)
+            values = self.get_option_values(params, parser, args)
             self.options = \
                 params.get_dpr_from_args(prog=prog, args=args, usage=usage,
-                                         description=desc, epilog=epilog)
+                                         description=desc, epilog=epilog,
+                                         parser=parser, values=values)
         except UserError:
             raise
         except Exception as e:
@@ -209,3 +267,10 @@ class QuickAppBase(HasLogger):
             raise Exception(msg)  # XXX class
         
  
+
+
+def unwrap_arg(x):
+    """ Returns the value of an option with nargs=1 as parsed by argparse. """
+    if isinstance(x, list):
+        return x[0] if x else None
+    return x
@@ -1,15 +1,22 @@
-from compmake import comp_store
+from .utils.hot_contracts import contract_hot
 from compmake.utils import duration_human
-from conf_tools.utils import friendly_path
+from conf_tools.utils import friendly_path, indent
+from contextlib import contextmanager
 from contracts import contract, describe_type, describe_value
 from pprint import pformat
 from quickapp import logger
 from reprep import Report
 from reprep.report_utils import StoreResults
 from reprep.utils import frozendict2, natsorted
+import cPickle as pickle
+import hashlib
+import json
+import multiprocessing
 import numpy as np
 import os
+import re
 import time
+import traceback
 
 __all__ = ['ReportManager']
 
@@ -17,11 +24,32 @@ __all__ = ['ReportManager']
 class ReportManager(object):
     # TODO: make it use a context
     
-    def __init__(self, outdir, index_filename=None):
+    def __init__(self, outdir, index_filename=None, index_update_interval=60,
+                 max_reports_per_page=500, job_id_base=None):
+        """
+            :param job_id_base: the jobs that write the reports in batches
+             and the index are called "<base>-batch<k>" and "index-<base>";
+             by default, the base is the name of the index file. 
+            :param index_update_interval: while reports are being written,
+             the index is re-rendered at most once every this many seconds;
+             a final job renders it once all reports are written. 
+            :param max_reports_per_page: above this, the index is split
+             in one page per report type and sub-pages (see index_reports()).
+        """
         self.outdir = outdir
         if index_filename is None:
             index_filename = os.path.join(self.outdir, 'report_index.html')
         self.index_filename = index_filename
+        if job_id_base is None:
+            job_id_base = os.path.splitext(os.path.basename(index_filename))[0]
+        self.job_id_base = re.sub('[^A-Za-z0-9_]', '_', job_id_base)
+        # each write job appends a record (key, filename, mtime) here
+        self.manifest_filename = os.path.splitext(index_filename)[0] + '.manifest'
+        # allreports_filename is shared with the jobs through this file
+        self.allreports_filename_file = (os.path.splitext(index_filename)[0] + 
+                                         '-filenames.pickle')
+        self.index_update_interval = index_update_interval
+        self.max_reports_per_page = max_reports_per_page
         self.allreports = StoreResults()
         self.allreports_filename = StoreResults()
 
@@ -30,9 +58,16 @@ class ReportManager(object):
         
         self.html_resources_prefix = ''
         
+        # if not None, reports are written in batches (see set_write_batch())
+        self.write_nbatches = None
+        self.write_processes = None
+        
         # check if we are called more than once; would be a bug
         self.index_job_created = False
         
+        # list of (title, filename) of other pages linked from the index
+        self.links = []
+        
     def set_html_resources_prefix(self, prefix):
         """ 
             Sets the prefix for the resources filename.
@@ -41,6 +76,45 @@ class ReportManager(object):
         """
         self.html_resources_prefix = prefix + '-'
     
+    @contract(title='str', filename='str')
+    def add_link(self, title, filename):
+        """ 
+            Adds a link to another page (e.g. written after the jobs 
+            are done) at the top of the index. 
+        """
+        self.links.append((title, filename))
+
+    def write_index_now(self):
+        """ 
+            Renders the index in this process, if the index job was created
+            and the reports were written; this is used to update the links 
+            when the index job was already done. 
+        """
+        if not (self.index_job_created and self.allreports and
+                os.path.exists(self.allreports_filename_file) and 
+                os.path.exists(self.manifest_filename)):
+            return
+        write_index_from_manifest(reports=self.allreports_filename_file,
+                                  index=self.index_filename,
+                                  manifest_filename=self.manifest_filename,
+                                  max_reports_per_page=self.max_reports_per_page,
+                                  links=self.links)
+
+    @contract(nbatches='None|int,>=1', processes='None|int,>=1')
+    def set_write_batch(self, nbatches, processes=None):
+        """ 
+            Writes the reports in ``nbatches`` jobs, instead of one job per 
+            report. In each job, the reports are rendered in parallel by a 
+            pool of ``processes`` processes (default: number of CPUs).
+            
+            The batch of a report depends only on its job id, so adding 
+            a report redoes only the batch it goes into.
+            
+            Use nbatches=None to go back to one job per report.
+        """
+        self.write_nbatches = nbatches
+        self.write_processes = processes
+    
     def _check_report_format(self, report_type, **kwargs):
         keys = sorted(list(kwargs.keys()))
         # print('report %r %r' % (report_type, keys))
@@ -57,7 +131,7 @@ class ReportManager(object):
         key = frozendict2(report=report_type, **kwargs)
         return self.allreports[key]
     
-    @contract(report_type='str')
+    @contract_hot(report_type='str')
     def add(self, report, report_type, **kwargs):
         """
             Adds a report to the collection.
@@ -116,59 +190,197 @@ class ReportManager(object):
         from compmake import comp
         
         # Do not pass as argument, it will take lots of memory!
-        # XXX FIXME: there should be a way to make this update or not
-        # otherwise new reports do not appear
-        optimize_space = False
-        if optimize_space and len(self.allreports_filename) > 100:
-            allreports_filename = comp_store(self.allreports_filename, 'allfilenames')
-        else:
-            allreports_filename = self.allreports_filename
+        # The jobs get the name of the file, which is updated when
+        # the jobs are defined again (possibly with new reports).
+        allreports_filename = write_shared_artifact(self.allreports_filename_file,
+                                                    self.allreports_filename)
         
         type2reports = {}    
         for report_type, xs in self.allreports_filename.groups_by_field_value('report'):
             type2reports[report_type] = StoreResults(**xs.remove_field('report'))
         
+        # find the closest report for different type, for all reports at once
+        type2others = get_most_similar_all(type2reports)
+        
+        # index used to create the links to reports of the same type
+        type2variations = dict((report_type, VariationsIndex(reports))
+                               for report_type, reports in type2reports.items())
             
+        # list of (job_id, arguments for write_report_and_update)
+        writes = []
         for key in self.allreports: 
             job_report = self.allreports[key]
             filename = self.allreports_filename[key] 
 
             write_job_id = job_report.job_id + '-write'
             
-            # Create the links to reports of the same type
             report_type = key['report']
-            other_reports_same_type = type2reports[report_type]
             
             key = dict(**key)
             del key['report']
 
-            # find the closest report for different type
-            others = []
-            for other_type, other_type_reports in type2reports.items():
-                if other_type == report_type:
-                    continue
-                best = get_most_similar(other_type_reports, key)
-                if best is not None:
-#                     print('Best match:\n-%s %s\n- %s %s' % (report_type, key,
-#                                                             other_type, best))
-                    others.append((other_type, best, other_type_reports[best]))
+            # Create the links to reports of the same type
+            links_table = type2variations[report_type].links_table(key)
+
+            others = type2others[report_type][frozendict2(key)]
             
             report_type_sane = report_type.replace('_', '')
             report_nid = self.html_resources_prefix + report_type_sane
             if key: 
                 report_nid += '-' + basename_from_key(key) 
             
-            comp(write_report_and_update,
-                 report=job_report, report_nid=report_nid,
-                report_html=filename, all_reports=allreports_filename,
-                index_filename=self.index_filename,
-                 write_pickle=False,
-                 this_report=key,
-                 other_reports_same_type=other_reports_same_type,
-                 most_similar_other_type=others,
-                 job_id=write_job_id)
+            write_args = dict(report=job_report, report_nid=report_nid,
+                              report_html=filename, all_reports=allreports_filename,
+                              index_filename=self.index_filename,
+                              write_pickle=False,
+                              links_table=links_table,
+                              most_similar_other_type=others,
+                              manifest_filename=self.manifest_filename,
+                              index_update_interval=self.index_update_interval,
+                              max_reports_per_page=self.max_reports_per_page)
+            writes.append((write_job_id, write_args))
+        
+        write_jobs = []
+        if self.write_nbatches is None:
+            for write_job_id, write_args in writes:
+                write_job = comp(write_report_and_update, job_id=write_job_id,
+                                 **write_args)
+                write_jobs.append(write_job)
+        else:
+            # the bucket of a report depends only on its job id and the 
+            # number of buckets, which is fixed
+            nbatches = self.write_nbatches
+            buckets = [[] for _ in range(nbatches)]
+            for write in sorted(writes, key=lambda x: x[0]):
+                buckets[batch_bucket(write[0], nbatches)].append(write)
+            for k, batch in enumerate(buckets):
+                if not batch:
+                    continue
+                write_job_id = '%s-batch%d' % (self.job_id_base, k)
+                write_job = comp(write_reports_batch,
+                                 writes=[write_args for _, write_args in batch],
+                                 processes=self.write_processes,
+                                 job_id=write_job_id)
+                write_jobs.append(write_job)
+        
+        # Render the complete index once, after all reports are written.
+        comp(write_index_from_manifest, reports=allreports_filename,
+             index=self.index_filename, manifest_filename=self.manifest_filename,
+             max_reports_per_page=self.max_reports_per_page,
+             links=self.links, extra_dep=write_jobs, 
+             job_id='index-%s' % self.job_id_base)
+
+
+@contract(job_id='str', nbatches='int,>=1', returns='int,>=0')
+def batch_bucket(job_id, nbatches):
+    """ Returns the batch (0..nbatches-1) in which the report is written. """
+    return int(int(hashlib.md5(job_id).hexdigest(), 16) % nbatches)
+
+
+@contract(type2reports='dict(str:StoreResults)', returns='dict(str:dict)')
+def get_most_similar_all(type2reports):
+    """ 
+        Finds, for all reports, the most similar report of each other type,
+        with the same semantics as get_most_similar().
+        
+        The keys of each report type are encoded once as integer arrays,
+        and the scores are computed in a vectorized way.  
+        
+        Returns a dict report_type -> key -> list of 
+        (other_type, other_key, filename).
+    """
+    codes = {}
+    type2keys = {}
+    type2matrix = {}
+    for report_type, reports in type2reports.items():
+        keys = list(reports.keys())
+        type2keys[report_type] = keys
+        type2matrix[report_type] = encode_keys(keys, codes)
+    
+    type2others = {}
+    for report_type, keys in type2keys.items():
+        others = dict((key, []) for key in keys)
+        for other_type, other_keys in type2keys.items():
+            if other_type == report_type:
+                continue
+            other_reports = type2reports[other_type]
+            best = most_similar_indices(type2matrix[report_type],
+                                        type2matrix[other_type])
+            for key, b in zip(keys, best):
+                if b >= 0:
+                    best_key = other_keys[b]
+                    others[key].append((other_type, best_key,
+                                        other_reports[best_key]))
+        type2others[report_type] = others
+    return type2others
 
 
+def encode_keys(keys, codes):
+    """ 
+        Encodes the values of the keys as an integer matrix, 
+        with one row per key and one column per field.
+        
+        :param codes: dict value -> code, shared among all calls,
+          updated with new values.
+        
+        Missing fields and values repeated in the same key are encoded as -1;
+        the score only counts distinct values.
+    """
+    fields = set()
+    for key in keys:
+        fields.update(key.keys())
+    fields = sorted(fields)
+    
+    X = np.empty((len(keys), len(fields)), dtype='int64')
+    for r, key in enumerate(keys):
+        seen = set()
+        for c, field in enumerate(fields):
+            if not field in key:
+                X[r, c] = -1
+                continue
+            code = codes.setdefault(key[field], len(codes))
+            if code in seen:
+                code = -1
+            else:
+                seen.add(code)
+            X[r, c] = code
+    return X
+
+
+def most_similar_indices(A, B, max_block_size=1 << 22):
+    """ 
+        Given two matrices of codes as returned by encode_keys(), 
+        returns for each row of A the index of the row of B that shares 
+        most values, or -1 if there is a tie.
+        
+        The score matrix is computed in blocks of rows of A, so that 
+        each block has at most ``max_block_size`` elements.
+    """
+    n_a = A.shape[0]
+    n_b = B.shape[0]
+    best = np.empty(n_a, dtype='int64')
+    if n_b == 0:
+        best.fill(-1)
+        return best
+    
+    block = max(1, max_block_size // n_b)
+    for start in range(0, n_a, block):
+        a = A[start:start + block]
+        scores = np.zeros((a.shape[0], n_b), dtype='int32')
+        for i in range(A.shape[1]):
+            ai = a[:, i][:, np.newaxis]
+            valid = ai >= 0
+            for j in range(B.shape[1]):
+                scores += (ai == B[:, j][np.newaxis, :]) & valid
+        
+        best_b = np.argmax(scores, axis=1)
+        best_score = scores[np.arange(a.shape[0]), best_b]
+        tie = np.sum(scores == best_score[:, np.newaxis], axis=1) > 1
+        best_b[tie] = -1
+        best[start:start + a.shape[0]] = best_b
+    return best
+        
+
 def get_most_similar(reports_different_type, key):
     """ Returns the report of another type that is most similar to this report. """
     
@@ -190,26 +402,22 @@ def get_most_similar(reports_different_type, key):
     return best
     
     
-@contract(other_reports_same_type=StoreResults)
-def create_links_html(this_report, other_reports_same_type, index_filename,
+@contract(report_html='str', links_table='list(tuple(str, list))')
+def create_links_html(report_html, links_table, index_filename,
                       most_similar_other_type):
     '''
-    :param this_report: dictionary with the keys describing the report
-    :param other_reports_same_type: StoreResults -> filename
+    :param report_html: filename of this report
+    :param links_table: as returned by VariationsIndex.links_table()
     :returns: html string describing the link
     '''
     
     def rel_link(f):
-        # TODO: make it relative
-        f0 = other_reports_same_type[this_report]
-        rl = os.path.relpath(f, os.path.dirname(f0))
-        return rl
-
+        return rel_link_fast(f, report_html)
 
     s = ""
 
     # create table by cols
-    table = create_links_html_table(this_report, other_reports_same_type)
+    table = links_table
     
     s += "<p><a href='%s'>All reports</a></p>" % rel_link(index_filename)
     
@@ -249,51 +457,97 @@ def create_links_html(this_report, other_reports_same_type, index_filename,
     return s
 
 
-@contract(returns="list( tuple(str, *))", other_reports_same_type=StoreResults)
-def create_links_html_table(this_report, other_reports_same_type):
-    # Iterate over all keys (each key gets a column)
+def rel_link_fast(f, f0):
+    """ Link to file f from the page f0. """
+    dirname = os.path.dirname(f0)
+    if os.path.dirname(f) == dirname:
+        # common case: reports of the same type 
+        return os.path.basename(f)
+    return os.path.relpath(f, dirname)
+
+
+class VariationsIndex(object):
+    """ 
+        Index of the reports of one type, used to find the variations
+        of a report obtained by changing only one field value. 
+        
+        It is built once for all reports of the type, so that the 
+        links table of each report is computed with O(fields * values)
+        dictionary lookups.
+    """
     
-    def rel_link(f):
-        # TODO: make it relative
-        f0 = other_reports_same_type[this_report]
-        rl = os.path.relpath(f, os.path.dirname(f0))
-        return rl
-
-    cols = []
-    fieldnames = other_reports_same_type.field_names()
-    for field in fieldnames:
-        field_values = other_reports_same_type.field_values(field)
-        field_values = sorted(list(set(field_values)))
-        col = []
-        for fv in field_values:
-            if fv == this_report[field]:
-                res = ('<span style="font-weight:bold">%s</span>' % str(fv), None)
-            else:
-                # this is the variation obtained by changing only one field value
-                variation = dict(**this_report)
-                variation[field] = fv
-                # if it doesn't exist:
-                if not variation in other_reports_same_type:
-                    res = ('%s (n/a)' % str(fv), None)
+    @contract(reports=StoreResults)
+    def __init__(self, reports):
+        self.reports = reports
+        self.fieldnames = reports.field_names()
+        # field -> sorted list of values
+        self.field_values = {}
+        # (field, key without field) -> value -> filename
+        self.neighbors = {}
+        for field in self.fieldnames:
+            self.field_values[field] = sorted(set(reports.field_values(field)))
+        for key, filename in reports.items():
+            for field in self.fieldnames:
+                if not field in key:
+                    continue
+                rest = VariationsIndex._rest(key, field)
+                self.neighbors.setdefault((field, rest), {})[key[field]] = filename
+
+    @staticmethod
+    def _rest(key, field):
+        return frozenset((k, v) for k, v in key.items() if k != field)
+    
+    @contract(returns="list( tuple(str, *))", this_report='dict')
+    def links_table(self, this_report):
+        # Iterate over all keys (each key gets a column)
+        f0 = self.reports[this_report]
+        cols = []
+        for field in self.fieldnames:
+            neighbors = self.neighbors[(field, VariationsIndex._rest(this_report, field))]
+            col = []
+            for fv in self.field_values[field]:
+                if fv == this_report[field]:
+                    res = ('<span style="font-weight:bold">%s</span>' % str(fv), None)
                 else:
-                    res = (fv, rel_link(other_reports_same_type[variation]))
-            col.append(res)
-        cols.append((field, col))
-    return cols
+                    # this is the variation obtained by changing only one field value
+                    # if it doesn't exist:
+                    if not fv in neighbors:
+                        res = ('%s (n/a)' % str(fv), None)
+                    else:
+                        res = (fv, rel_link_fast(neighbors[fv], f0))
+                col.append(res)
+            cols.append((field, col))
+        return cols
+    
+
+@contract(returns="list( tuple(str, *))", other_reports_same_type=StoreResults)
+def create_links_html_table(this_report, other_reports_same_type):
+    return VariationsIndex(other_reports_same_type).links_table(this_report)
     
     
-@contract(report=Report, report_nid='str', other_reports_same_type=StoreResults)
+@contract(report=Report, report_nid='str', links_table='list(tuple(str, list))',
+          manifest_filename='str', index_update_interval='>=0')
 def write_report_and_update(report, report_nid, report_html, all_reports, index_filename,
-                            this_report,
-                            other_reports_same_type,
+                            links_table,
                             most_similar_other_type,
+                            manifest_filename,
+                            index_update_interval=60,
+                            max_reports_per_page=500,
                             write_pickle=False):
+    """ 
+        Writes the report and appends its record to the manifest.
+        The index is re-rendered only if it is older than
+        ``index_update_interval`` seconds. 
+        
+        :param all_reports: filename written by write_shared_artifact(),
+         containing the StoreResults with all the report filenames.
+    """
     
     if not isinstance(report, Report):
         msg = 'Expected Report, got %s.' % describe_type(report)
         raise ValueError(msg) 
     
-    links = create_links_html(this_report, other_reports_same_type, index_filename,
+    links = create_links_html(report_html, links_table, index_filename,
                               most_similar_other_type=most_similar_other_type)
 
     tree_html = '<pre style="display:none">%s</pre>' % report.format_tree()
@@ -303,7 +557,166 @@ def write_report_and_update(report, report_nid, report_html, all_reports, index_
 
     report.nid = report_nid
     html = write_report(report, report_html, write_pickle=write_pickle, **extras)
-    index_reports(reports=all_reports, index=index_filename, update=html)
+    manifest_append(manifest_filename, filename=html)
+    
+    if index_is_stale(index_filename, index_update_interval):
+        mtimes = manifest_read(manifest_filename)
+        all_reports = read_shared_artifact(all_reports)
+        index_reports(reports=all_reports, index=index_filename, update=html,
+                      mtimes=mtimes, max_reports_per_page=max_reports_per_page)
+
+
+def write_report_or_traceback(**write_args):
+    """ 
+        Calls write_report_and_update(), in a worker of the pool; 
+        returns None, or the traceback of the error, which would be 
+        lost in the parent. 
+    """
+    try:
+        write_report_and_update(**write_args)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+@contract(writes='list(dict)', processes='None|int,>=1')
+def write_reports_batch(writes, processes=None):
+    """ 
+        Writes a batch of reports, calling write_report_and_update()
+        for each element of ``writes`` in a pool of processes.
+        
+        If we are already in a daemon process (such as a worker of
+        "parmake"), which cannot have children, the reports are written
+        sequentially.
+    """
+    if len(writes) == 1 or processes == 1 or multiprocessing.current_process().daemon:
+        for write_args in writes:
+            write_report_and_update(**write_args)
+        return
+    
+    errors = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = [pool.apply_async(write_report_or_traceback, kwds=write_args)
+                   for write_args in writes]
+        for write_args, result in zip(writes, results):
+            error = result.get()
+            if error is not None:
+                errors.append('%s:\n%s' % (write_args['report_html'], error))
+    finally:
+        pool.close()
+        pool.join()
+    
+    if errors:
+        msg = 'Could not write %d of %d reports:\n' % (len(errors), len(writes))
+        msg += indent('\n'.join(errors), '> ')
+        raise Exception(msg)
+
+
+@contract(reports='str', index='str', manifest_filename='str')
+def write_index_from_manifest(reports, index, manifest_filename,
+                              max_reports_per_page=500, links=[]):
+    """ 
+        Renders the index in one pass using the mtimes recorded in the
+        manifest; the manifest is compacted to the current reports.
+        
+        :param reports: filename written by write_shared_artifact().
+    """
+    reports = read_shared_artifact(reports)
+    mtimes = manifest_read(manifest_filename)
+    filenames = set(reports.values())
+    mtimes = dict((k, v) for k, v in mtimes.items() if k in filenames)
+    manifest_write(manifest_filename, mtimes)
+    index_reports(reports=reports, index=index, mtimes=mtimes,
+                  max_reports_per_page=max_reports_per_page, links=links)
+
+
+@contract(filename='str', returns='str')
+def write_shared_artifact(filename, ob):
+    """ 
+        Pickles the object to the given file, which is used as a handle
+        to share it with many jobs without passing it as an argument.
+        
+        The file is rewritten only if the contents changed, so that
+        re-defining the same jobs does not touch it. Returns the filename.
+    """
+    data = pickle.dumps(ob, pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(filename):
+        with open(filename, 'rb') as f:
+            previous = f.read()
+        if previous == data:
+            return filename
+        
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp = '%s.%s.tmp' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.rename(tmp, filename)
+    return filename
+
+
+@contract(filename='str')
+def read_shared_artifact(filename):
+    """ Loads an object written by write_shared_artifact(). """
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def index_is_stale(index, interval):
+    """ True if the index does not exist or is older than interval seconds. """
+    if not os.path.exists(index):
+        return True
+    return time.time() - os.path.getmtime(index) >= interval
+
+
+@contract(manifest_filename='str', filename='str')
+def manifest_append(manifest_filename, filename):
+    """ 
+        Appends the record for the given report file to the manifest.
+        
+        Each record is a single line, written with a single call, 
+        so that concurrent jobs can append to the same manifest.
+    """
+    record = dict(filename=filename, mtime=os.path.getmtime(filename))
+    line = json.dumps(record) + '\n'
+    dirname = os.path.dirname(manifest_filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    fd = os.open(manifest_filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contract(manifest_filename='str', returns='dict(str:float)')
+def manifest_read(manifest_filename):
+    """ Returns a dict filename -> mtime; later records win. """
+    mtimes = {}
+    if not os.path.exists(manifest_filename):
+        return mtimes
+    with open(manifest_filename) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # partially written line
+                continue
+            mtimes[str(record['filename'])] = float(record['mtime'])
+    return mtimes
+
+
+@contract(manifest_filename='str', mtimes='dict(str:float)')
+def manifest_write(manifest_filename, mtimes):
+    """ Rewrites the manifest with the given records. """
+    tmp = manifest_filename + '.tmp'
+    with open(tmp, 'w') as f:
+        for filename in sorted(mtimes):
+            record = dict(filename=filename, mtime=mtimes[filename])
+            f.write(json.dumps(record) + '\n')
+    os.rename(tmp, manifest_filename)
 
 
 
@@ -323,13 +736,27 @@ def write_report(report, report_html, write_pickle=False, **kwargs):
 
 
 
-@contract(reports=StoreResults, index=str)
-def index_reports(reports, index, update=None):  # @UnusedVariable
+@contract(reports=StoreResults, index=str, mtimes='None|dict(str:float)',
+          max_reports_per_page='int,>=1', links='list(tuple(str,str))')
+def index_reports(reports, index, update=None, mtimes=None,  # @UnusedVariable
+                  max_reports_per_page=500, links=[]):
     """
         Writes an index for the reports to the file given. 
         The special key "report" gives the report type.
         
         reports[dict(report=...,param1=..., param2=...) ] => filename
+        
+        If given, ``mtimes`` (filename -> mtime) lists the reports
+        that exist; otherwise the filesystem is queried.
+        
+        ``links`` is a list of (title, filename) of other pages to link.
+        
+        If there are more than ``max_reports_per_page`` reports, the index
+        is sharded: the main page links to one page per report type, 
+        and any group with too many reports is moved to a sub-page, 
+        which are written in the directory "<index>-index/"; a page with
+        too many groups links to sub-pages with ranges of them. The pages
+        of that directory that are not used anymore are removed.
     """
     # print('Updating because of new report %s' % update)
     
@@ -339,33 +766,23 @@ def index_reports(reports, index, update=None):  # @UnusedVariable
     
     # logger.info('Writing on %s' % friendly_path(index))
     
-    f = open(index, 'w')
-    
-    f.write("""
-        <html>
-        <head>
-        <style type="text/css">
-        span.when { float: right; }
-        li { clear: both; }
-        a.self { color: black; text-decoration: none; }
-        </style>
-        </head>
-        <body>
-    """)
-    
-    mtime = lambda x: os.path.getmtime(x)
-    existing = filter(lambda x: os.path.exists(x[1]), reports.items())
+    if mtimes is None:
+        mtimes = {}
+        for filename in reports.values():
+            if os.path.exists(filename):
+                mtimes[filename] = os.path.getmtime(filename)
 
+    mtime = lambda x: mtimes[x]
+    existing = filter(lambda x: x[1] in mtimes, reports.items())
  
     # create order statistics
-    alltimes = np.array([mtime(b) for _, b in existing]) 
+    alltimes = np.sort(np.array([mtime(b) for _, b in existing])) 
     
     def order(filename):
         """ returns between 0 and 1 the order statistics """
-        assert os.path.exists(filename)
         histime = mtime(filename)
-        compare = (alltimes < histime) 
-        return np.mean(compare * 1.0)
+        # fraction of reports strictly older than this one
+        return np.searchsorted(alltimes, histime, side='left') * 1.0 / len(alltimes)
         
     def style_order(order):
         if order > 0.95:
@@ -377,11 +794,11 @@ def index_reports(reports, index, update=None):  # @UnusedVariable
         return ""     
         
     @contract(k=dict, filename=str)
-    def write_li(k, filename, element='li'):
+    def write_li(f, page, k, filename, element='li'):
         desc = ",  ".join('%s = %s' % (a, b) for a, b in k.items())
-        href = os.path.relpath(filename, os.path.dirname(index))
+        href = os.path.relpath(filename, os.path.dirname(page))
         
-        if os.path.exists(filename):
+        if filename in mtimes:
             when = duration_human(time.time() - mtime(filename))
             span_when = '<span class="when">%s ago</span>' % when
             style = style_order(order(filename))
@@ -394,84 +811,204 @@ def index_reports(reports, index, update=None):  # @UnusedVariable
         f.write('<%s style="%s">%s %s</%s>' % (element, style, a, span_when,
                                                element))
 
-        
-    # write the first 10
-    existing.sort(key=lambda x: (-mtime(x[1])))
-    nlast = min(len(existing), 10)
-    last = existing[:nlast]
-    f.write('<h2 id="last">Last %d reports</h2>\n' % (nlast))
+    shards_dir = os.path.splitext(index)[0] + '-index'
+    # the sub-pages written now; the others are removed at the end
+    written = set()
 
-    f.write('<ul>')
-    for i in range(nlast):
-        write_li(*last[i])
-    f.write('</ul>')
+    def shard_filename(names):
+        name = "-".join(map(str, names))
+        name = re.sub('[^A-Za-z0-9_.=-]', '_', name)
+        return os.path.join(shards_dir, name + '.html')
 
-    if False:
-        for report_type, r in reports.groups_by_field_value('report'):
-            f.write('<h2 id="%s">%s</h2>\n' % (report_type, report_type))
-            f.write('<ul>')
-            r = reports.select(report=report_type)
-            items = list(r.items()) 
-            items.sort(key=lambda x: str(x[0]))  # XXX use natsort   
-            for k, filename in items:
-                write_li(k, filename)
-    
-            f.write('</ul>')
-    
-    f.write('<h2>All reports</h2>\n')
-
-    try:
-        sections = make_sections(reports)
-    except:
-        logger.error(str(reports.keys()))
-        raise
-    
-    if  sections['type'] == 'sample':
-        # only one...
-        sections = dict(type='division', field='raw',
-                          division=dict(raw1=sections), common=dict())
-        
-        
-    def write_sections(sections, parents):
+    def write_sections(f, page, sections, parents, inline, values=None):
+        """ 
+            Writes the division "sections" (only the given values, if any). 
+            If not inline, the sub-divisions are written to their own pages,
+            and, if there are too many values, they are split in ranges,
+            each on its own page. 
+            ``parents`` is the list of (field, value) above. 
+        """
         assert 'type' in sections
         assert sections['type'] == 'division', sections
         field = sections['field']
         division = sections['division']
+        if values is None:
+            values = natsorted(division.keys())
+
+        if not inline and len(values) > max_reports_per_page:
+            f.write('<ul>')
+            size = int(np.ceil(len(values) / float(max_reports_per_page)))
+            for i in range(0, len(values), size):
+                chunk = values[i:i + size]
+                desc = '%s = %s .. %s' % (field, chunk[0], chunk[-1])
+                names = ['%s=%s' % x for x in parents]
+                names.append('%s=%s..%s' % (field, chunk[0], chunk[-1]))
+                sub_page = shard_filename(names)
+                n = sum(division[v]['n'] for v in chunk)
+                write_page(sub_page, desc, sections, parents, values=chunk)
+                href = os.path.relpath(sub_page, os.path.dirname(page))
+                f.write('<li><a href="%s">%s</a> (%d reports)</li>\n' 
+                        % (href, desc, n))
+            f.write('</ul>')
+            return
 
         f.write('<ul>')
-        sorted_values = natsorted(division.keys())
-        for value in sorted_values:
-            parents.append(value)
-            html_id = "-".join(map(str, parents))            
+        for value in values:
+            parents.append((field, value))
+            # same anchors as the unsharded index: the values only
+            html_id = "-".join(str(v) for _, v in parents)
             bottom = division[value]
             if bottom['type'] == 'sample':
                 d = {field: value}
                 if not bottom['key']:
-                    write_li(k=d, filename=bottom['value'], element='li')
+                    write_li(f, page, k=d, filename=bottom['value'], element='li')
                 else:
                     f.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n' 
                             % (html_id, html_id, field, value))
                     f.write('<ul>')
-                    write_li(k=bottom['key'], filename=bottom['value'], element='li')
+                    write_li(f, page, k=bottom['key'], filename=bottom['value'],
+                             element='li')
                     f.write('</ul>')
                     f.write('</li>')
-            else:
+            elif inline:
                 f.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n' 
                         % (html_id, html_id, field, value))
 
-                write_sections(bottom, parents)
+                write_sections(f, page, bottom, parents, inline=True)
                 f.write('</li>')
+            else:
+                sub_page = shard_filename(['%s=%s' % x for x in parents])
+                title = ", ".join('%s=%s' % x for x in parents)
+                write_page(sub_page, title, bottom, list(parents))
+                href = os.path.relpath(sub_page, os.path.dirname(page))
+                f.write('<li id="%s"><a href="%s">%s = %s</a> (%d reports)</li>\n' 
+                        % (html_id, href, field, value, bottom['n']))
+            parents.pop()
         f.write('</ul>') 
-                
-    write_sections(sections, parents=[])
     
-    f.write('''
+    def write_page(page, title, sections, parents, values=None):
+        """ 
+            Writes a sub-page of the index with the given sections; 
+            they are split further if there are too many reports. 
+        """ 
+        written.add(page)
+        if values is None:
+            n = sections['n']
+        else:
+            n = sum(sections['division'][v]['n'] for v in values)
+        with open_index_page(page) as f:
+            href = os.path.relpath(index, os.path.dirname(page))
+            f.write('<p><a href="%s">All reports</a></p>\n' % href)
+            f.write('<h2>%s</h2>\n' % title)
+            inline = n <= max_reports_per_page
+            write_sections(f, page, sections, parents, inline=inline,
+                           values=values)
+        
+    with open_index_page(index) as f:
+        for title, filename in links:
+            href = os.path.relpath(filename, dirname)
+            f.write('<p><a href="%s">%s</a></p>\n' % (href, title))
+        
+        # write the first 10
+        existing.sort(key=lambda x: (-mtime(x[1])))
+        nlast = min(len(existing), 10)
+        last = existing[:nlast]
+        f.write('<h2 id="last">Last %d reports</h2>\n' % (nlast))
     
-    </body>
-    </html>
+        f.write('<ul>')
+        for i in range(nlast):
+            write_li(f, index, *last[i])
+        f.write('</ul>')
+        
+        f.write('<h2>All reports</h2>\n')
     
-    ''')
-    f.close()
+        if len(reports) <= max_reports_per_page:
+            sections = make_sections_or_raise(reports)
+            
+            if  sections['type'] == 'sample':
+                # only one...
+                sections = dict(type='division', field='raw',
+                                division=dict(raw1=sections), common=dict(), n=1)
+            
+            write_sections(f, index, sections, parents=[], inline=True)
+        else:
+            # one page for each report type
+            division = {}
+            for report_type, samples in reports.groups_by_field_value('report'):
+                samples = samples.remove_field('report')
+                c = dict(report=report_type)
+                division[report_type] = make_sections_or_raise(samples, common=c)
+            sections = dict(type='division', field='report', division=division,
+                            common=dict(), n=len(reports))
+            write_sections(f, index, sections, parents=[], inline=False)
+
+    remove_orphan_pages(shards_dir, written)
+
+
+def remove_orphan_pages(shards_dir, written):
+    """ Removes the pages in shards_dir that are not in ``written``. """
+    if not os.path.exists(shards_dir):
+        return
+    for name in os.listdir(shards_dir):
+        filename = os.path.join(shards_dir, name)
+        if name.endswith('.html') and not filename in written:
+            try:
+                os.unlink(filename)
+            except OSError:
+                # removed by another job meanwhile
+                pass
+
+
+@contextmanager
+def open_index_page(filename):
+    """ 
+        Opens an index page for writing, adding header and footer. 
+        
+        The page is written to a temporary file and then renamed, 
+        as other jobs might be updating the index; if writing fails,
+        the temporary file is removed.
+    """
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp = '%s.%s.tmp' % (filename, os.getpid())
+    f = open(tmp, 'w')
+    try:
+        f.write("""
+        <html>
+        <head>
+        <style type="text/css">
+        span.when { float: right; }
+        li { clear: both; }
+        a.self { color: black; text-decoration: none; }
+        </style>
+        </head>
+        <body>
+        """)
+        
+        yield f
+        
+        f.write('''
+        
+        </body>
+        </html>
+        
+        ''')
+        f.close()
+        os.rename(tmp, filename)
+    finally:
+        # only if something failed before the rename
+        f.close()
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def make_sections_or_raise(allruns, common=None):
+    try:
+        return make_sections(allruns, common=common)
+    except:
+        logger.error(str(allruns.keys()))
+        raise
 
 
 def make_sections(allruns, common=None):
@@ -484,7 +1021,7 @@ def make_sections(allruns, common=None):
     if len(allruns) == 1:
         key = allruns.keys()[0]
         value = allruns[key]
-        return dict(type='sample', common=common, key=key, value=value)
+        return dict(type='sample', common=common, key=key, value=value, n=1)
     
     fields_size = [(field, len(list(allruns.groups_by_field_value(field))))
                     for field in allruns.field_names_in_all_keys()]
@@ -514,7 +1051,7 @@ def make_sections(allruns, common=None):
             raise
         
     return dict(type='division', field=field,
-                division=division, common=common)
+                division=division, common=common, n=len(allruns))
 
     
     
@@ -0,0 +1,158 @@
+from .utils.hot_contracts import contract_hot
+from compmake.jobs import get_job_cache
+from contracts import contract
+import json
+import os
+
+__all__ = ['ResourceGraph']
+
+
+class ResourceGraph(object):
+    """
+        Records the requests of resources made through the ResourceManager.
+
+        The resources form a DAG: there is an edge from a resource to
+        each resource that was requested while providing it. Requests
+        made outside of any provider come from the node ROOT.
+    """
+
+    ROOT = 'root'
+
+    def __init__(self):
+        # node id -> dict(rtype, params, job_id)
+        self.nodes = {}
+        # requester node id -> set of node ids
+        self.children = {}
+        # list of dict(context, requester, node, job_id)
+        self.requests = []
+
+    @staticmethod
+    @contract_hot(rtype='str', params='dict', prefix='None|str', returns='str')
+    def node_id(rtype, params, prefix=None):
+        """
+            Returns the id of the node for the given resource.
+
+            The prefix is the job prefix of the ResourceManager providing
+            it: separate managers create separate jobs for the same
+            resource, so they get separate nodes.
+        """
+        args = ', '.join('%s=%s' % (k, params[k]) for k in sorted(params))
+        node = '%s(%s)' % (rtype, args)
+        if prefix is not None:
+            node = '%s:%s' % (prefix, node)
+        return node
+
+    @contract_hot(rtype='str', params='dict', job_id='str', prefix='None|str')
+    def add_request(self, context, rtype, params, job_id, prefix=None):
+        """
+            Records that the context requested the resource,
+            obtaining the job job_id from the manager with the given prefix.
+        """
+        node = ResourceGraph.node_id(rtype, params, prefix)
+        if not node in self.nodes:
+            self.nodes[node] = dict(rtype=rtype, params=dict(params), job_id=job_id)
+        requester = context.get_provided_resource()
+        if requester is None:
+            requester = ResourceGraph.ROOT
+        self.children.setdefault(requester, set()).add(node)
+        self.requests.append(dict(context=str(context), requester=requester,
+                                  node=node, job_id=job_id))
+
+    @contract(durations='dict(str:float)', returns='tuple(float, list(str))')
+    def critical_path(self, durations):
+        """
+            Returns the chain of resources with the longest total duration,
+            where the duration of a resource is the duration of its job
+            (durations: job_id -> seconds; missing means 0).
+
+            Returns the total duration and the list of node ids, starting
+            from the first requested resource.
+        """
+        # node -> (total, path) of the longest chain starting at node
+        best = {}
+
+        def longest(node):
+            if node in best:
+                return best[node]
+            if node == ResourceGraph.ROOT:
+                weight = 0.0
+            else:
+                weight = durations.get(self.nodes[node]['job_id'], 0.0)
+            total, path = 0.0, []
+            for child in self.children.get(node, []):
+                t, p = longest(child)
+                if t > total or not path:
+                    total, path = t, p
+            best[node] = (weight + total, [node] + path)
+            return best[node]
+
+        total = 0.0
+        path = []
+        for node in self.nodes:
+            t, p = longest(node)
+            if t > total or not path:
+                total, path = t, p
+        return total, path
+
+    def get_durations(self):
+        """ Returns job_id -> walltime for the resource jobs that were done. """
+        durations = {}
+        for node in self.nodes.values():
+            cache = get_job_cache(node['job_id'])
+            if cache.walltime_used is not None:
+                durations[node['job_id']] = float(cache.walltime_used)
+        return durations
+
+    def to_dict(self, durations=None):
+        """ Returns a structure that can be serialized as JSON. """
+        nodes = []
+        for node_id in sorted(self.nodes):
+            node = dict(self.nodes[node_id])
+            node['id'] = node_id
+            if durations is not None:
+                node['duration'] = durations.get(node['job_id'], None)
+            nodes.append(node)
+        edges = [(a, b) for a in sorted(self.children)
+                 for b in sorted(self.children[a])]
+        res = dict(nodes=nodes, edges=edges, requests=len(self.requests))
+        if durations is not None:
+            total, path = self.critical_path(durations)
+            res['critical_path'] = dict(duration=total, nodes=path)
+        return res
+
+    @contract(dirname='str', returns='list(str)')
+    def write(self, dirname, durations=None):
+        """
+            Writes the graph as "resources.json" and "resources.dot" in
+            the given directory. If durations are given, the critical
+            path is computed and highlighted.
+
+            Returns the list of files written.
+        """
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        data = self.to_dict(durations)
+
+        fn_json = os.path.join(dirname, 'resources.json')
+        with open(fn_json, 'w') as f:
+            json.dump(data, f, indent=1, default=str)
+
+        critical = set()
+        if 'critical_path' in data:
+            critical = set(data['critical_path']['nodes'])
+
+        fn_dot = os.path.join(dirname, 'resources.dot')
+        with open(fn_dot, 'w') as f:
+            f.write('digraph resources {\n')
+            for node in data['nodes']:
+                label = node['id']
+                if node.get('duration', None) is not None:
+                    # json.dumps() below escapes the newline as graphviz wants
+                    label += '\n%.1f s' % node['duration']
+                style = ', color=red' if node['id'] in critical else ''
+                f.write('  %s [label=%s%s];\n' % (json.dumps(node['id']),
+                                                  json.dumps(label), style))
+            for a, b in data['edges']:
+                f.write('  %s -> %s;\n' % (json.dumps(a), json.dumps(b)))
+            f.write('}\n')
+        return [fn_json, fn_dot]
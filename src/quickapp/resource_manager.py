@@ -1,8 +1,11 @@
+from .resource_graph import ResourceGraph
+from .utils.hot_contracts import contract_hot
 from collections import defaultdict
 from compmake import Promise
 from conf_tools.utils import check_is_in, indent
 from contracts import contract, describe_type
 from reprep.report_utils import StoreResults
+from reprep.utils import frozendict2
 import traceback
 
 __all__ = ['ResourceManager']
@@ -13,24 +16,52 @@ class ResourceManager(object):
     class CannotProvide(Exception):
         pass
 
-    def __init__(self, context):
+    def __init__(self, context, graph=None):
         from quickapp.compmake_context import CompmakeContext
         assert isinstance(context, CompmakeContext), context
+        # if not None, records who requested which resource; 
+        # shared with child managers (see set_graph())
+        self.graph = graph
         self.allresources = StoreResults()
+        # frozendict2(rtype=..., **params) => Promise; same contents as allresources
+        self._resources = {}
         self.providers = defaultdict(list)  # rtype => list of providers
+        # rtype => list of can_provide predicates (or None), parallel to providers 
+        self._can_provide = defaultdict(list)
         self.make_prefix = {}  # rtype => function to make prefix
         self._context = context
 
     @contract(rtype='str')
-    def set_resource_provider(self, rtype, provider):
+    def set_resource_provider(self, rtype, provider, can_provide=None):
         """
             provider: any callable. It will be called with "context" as first 
                 argument, and with any remaining params.
                 
+            can_provide: optional cheap predicate, called with the params, 
+                that says whether the provider can create the resource.
+                If not given, we use the attribute ``provider.can_provide``
+                if it exists; otherwise the provider is always called, and 
+                it can raise CannotProvide. 
+                
+            The predicates are evaluated when a resource is first
+            requested; then only the providers that can provide it 
+            are called.
         """
+        if can_provide is None:
+            can_provide = getattr(provider, 'can_provide', None)
         self.providers[rtype].append(provider)
+        self._can_provide[rtype].append(can_provide)
         
         
+    @contract(graph='None|isinstance(ResourceGraph)')
+    def set_graph(self, graph):
+        """ 
+            Records the requests of the resources in the given ResourceGraph
+            (None: do not record them), here and in the managers of the 
+            contexts created from now on.
+        """
+        self.graph = graph
+
     def set_resource_prefix_function(self, rtype, make_prefix):
         """
             make_prefix: a function that takes (rtype, **params) and 
@@ -39,22 +70,42 @@ class ResourceManager(object):
         self.make_prefix[rtype] = make_prefix
     
 
-    @contract(rtype='str')
+    @contract_hot(rtype='str')
     def get_resource(self, rtype, **params):
+        return self.request_resource(self._context, rtype, params)
+
+    @contract_hot(rtype='str', params='dict')
+    def request_resource(self, context, rtype, params):
+        """ 
+            Same as get_resource(), but records in the graph that
+            the request was made by the given context.
+        """
+        res = self._get_resource(rtype, params)
+        if self.graph is not None:
+            self.graph.add_request(context, rtype, params, res.job_id,
+                                   self._context.get_job_prefix())
+        return res
+
+    def _get_resource(self, rtype, params):
         # print('RM %s %s get_resource %s %s' % (id(self), self._context, rtype, params))
-        key = dict(rtype=rtype, **params)
-        already_done = key in self.allresources
-        if already_done:
-            return self.allresources[key]
+        key = frozendict2(rtype=rtype, **params)
+        res = self._resources.get(key, None)
+        if res is not None:
+            return res
 
         check_is_in('resource type', rtype, self.providers)
         
+        providers = self._get_providers(rtype, params)
+        
         prefix = self._make_prefix(rtype, **params)
         c = self._context.child(name=rtype, add_job_prefix=prefix, add_outdir=rtype)
+        # the requests made by the providers come from this resource
+        c.set_provided_resource(ResourceGraph.node_id(rtype, params,
+                                                      self._context.get_job_prefix()))
 
         ok = []
         errors = []
-        for provider in self.providers[rtype]:
+        for provider in providers:
             try:
                 res_i = provider(c, **params)
                 ok.append((provider, res_i))
@@ -69,6 +120,10 @@ class ResourceManager(object):
             
         if not ok:
             msg = 'No provider could create this resource:\n'
+            msg += ' type: %r params: %s\n' % (rtype, params)
+            if len(providers) < len(self.providers[rtype]):
+                n = len(self.providers[rtype]) - len(providers)
+                msg += '(%d providers declared they cannot provide it)\n' % n
             msg += "\n".join('- %s' % str(e) for e in  errors)
             raise Exception(msg)
         
@@ -84,6 +139,21 @@ class ResourceManager(object):
         self.set_resource(res, rtype, **params)
         return res
     
+    def _get_providers(self, rtype, params):
+        """ 
+            Returns the list of providers that can provide the resource.
+            
+            This is not memoized: each resource is resolved only once
+            (then it is in _resources), and the predicates depend on 
+            the values of the params, so no two requests share the result.
+        """
+        providers = []
+        for provider, can_provide in zip(self.providers[rtype],
+                                         self._can_provide[rtype]):
+            if can_provide is None or can_provide(**params):
+                providers.append(provider)
+        return providers
+    
     def _make_prefix(self, rtype, **params):
         """ Creates the job prefix for the given resource. """
         # use the user-defined if available
@@ -99,7 +169,7 @@ class ResourceManager(object):
         prefix = "-".join(alls)
         return prefix
         
-    @contract(rtype='str')
+    @contract_hot(rtype='str')
     def set_resource(self, goal, rtype, **params):
         key = dict(rtype=rtype, **params)
         if not isinstance(goal, Promise):
@@ -109,4 +179,5 @@ class ResourceManager(object):
             raise ValueError(msg)
         
         self.allresources[key] = goal
+        self._resources[frozendict2(**key)] = goal
          
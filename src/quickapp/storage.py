@@ -0,0 +1,476 @@
+from .compression import Codec
+from compmake.storage.filesystem import StorageFilesystem
+from compmake.structures import CompmakeException, SerializationError
+from compmake.utils import find_pickling_error
+from collections import OrderedDict
+from contracts import contract
+from quickapp import logger
+import cPickle as pickle
+import os
+import sqlite3
+import types
+
+__all__ = ['StorageSQLite', 'StorageCodec', 'MemoryCache', 'WriteBackCache',
+           'get_storage', 'storage_types']
+
+
+class StorageSQLite(object):
+    """
+        A compmake DB stored in a single SQLite file.
+
+        This avoids the many small files of StorageFilesystem, which are
+        a bottleneck on network filesystems. The values are pickled.
+        Each process opens its own connection, so it can be used
+        with parallel make. If a Codec is given, the values are compressed.
+
+        The values are always stored with the header of the Codec (the
+        uncompressed ones too), so that a DB written with any codec
+        can be read with any other.
+    """
+
+    def __init__(self, filename, codec=None):
+        self.filename = filename
+        if codec is None:
+            codec = Codec('none')
+        self.codec = codec
+        self._conn = None
+        self._pid = None
+
+    def __repr__(self):
+        return 'StorageSQLite(%r)' % self.filename
+
+    def _connection(self):
+        # connections cannot be shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            dirname = os.path.dirname(self.filename)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            conn = sqlite3.connect(self.filename, timeout=600,
+                                   isolation_level=None)
+            conn.text_factory = str
+            conn.execute('CREATE TABLE IF NOT EXISTS compmake '
+                         '(key TEXT PRIMARY KEY, value BLOB)')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def __getitem__(self, key):
+        cur = self._connection().execute('SELECT value FROM compmake WHERE key=?',
+                                         (key,))
+        row = cur.fetchone()
+        if row is None:
+            raise CompmakeException('Could not find key %r.' % key)
+        return pickle.loads(self.codec.decode(str(row[0])))
+
+    def __setitem__(self, key, value):
+        try:
+            s = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            msg = ('Cannot set key %s: cannot pickle object '
+                    'of class %s: %s' % (key, value.__class__.__name__, e))
+            logger.error(msg)
+            emsg = find_pickling_error(value)
+            raise SerializationError(msg + '\n' + emsg)
+        s = self.codec.encode(s)
+        self._connection().execute('INSERT OR REPLACE INTO compmake '
+                                   '(key, value) VALUES (?, ?)',
+                                   (key, sqlite3.Binary(s)))
+
+    def __delitem__(self, key):
+        cur = self._connection().execute('DELETE FROM compmake WHERE key=?',
+                                         (key,))
+        if cur.rowcount == 0:
+            msg = 'I expected key %r to exist before deleting' % key
+            raise ValueError(msg)
+
+    def __contains__(self, key):
+        cur = self._connection().execute('SELECT 1 FROM compmake WHERE key=?',
+                                         (key,))
+        return cur.fetchone() is not None
+
+    def keys(self):
+        cur = self._connection().execute('SELECT key FROM compmake ORDER BY key')
+        return [row[0] for row in cur]
+
+    def reopen_after_fork(self):
+        self._conn = None
+
+
+class StorageCodec(StorageFilesystem):
+    """
+        Like StorageFilesystem, one file per key, but the pickles are
+        compressed with the given Codec (instead of always with gzip).
+    """
+
+    @contract(codec=Codec)
+    def __init__(self, basepath, codec):
+        StorageFilesystem.__init__(self, basepath, compress=False)
+        self.file_extension = '.pickle.codec'
+        self.codec = codec
+
+    def __repr__(self):
+        return 'StorageCodec(%r, %r)' % (self.basepath, self.codec)
+
+    def __getitem__(self, key):
+        self.check_existence()
+        filename = self.filename_for_key(key)
+        if not os.path.exists(filename):
+            raise CompmakeException('Could not find key %r.' % key)
+        with open(filename, 'rb') as f:
+            encoded = f.read()
+        try:
+            return pickle.loads(self.codec.decode(encoded))
+        except Exception as e:
+            msg = 'Could not unpickle file %r: %s' % (filename, e)
+            raise CompmakeException(msg)
+
+    def __setitem__(self, key, value):
+        self.check_existence()
+        try:
+            s = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            msg = ('Cannot set key %s: cannot pickle object '
+                    'of class %s: %s' % (key, value.__class__.__name__, e))
+            logger.error(msg)
+            emsg = find_pickling_error(value)
+            raise SerializationError(msg + '\n' + emsg)
+        filename = self.filename_for_key(key)
+        tmp = '%s.tmp%s' % (filename, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(self.codec.encode(s))
+        os.rename(tmp, filename)
+
+
+class MemoryCache(object):
+    """
+        A write-through cache in front of a StorageFilesystem.
+
+        The pickled values read are kept in memory together with the
+        stamp (inode, modification and change time, size) that their file
+        had before it was read; a value is read from memory if the file
+        still has that stamp, which is the case unless another process 
+        wrote it (the files are replaced, so the inode changes). 
+        Each read unpickles a new copy, so the objects returned can be 
+        modified freely, as with the filesystem.
+
+        A write only drops the value from memory: the stamp of the new
+        file could already be that of a write by another process.
+    """
+
+    @contract(db=StorageFilesystem)
+    def __init__(self, db):
+        self.db = db
+        # key -> (stamp, pickled value)
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'MemoryCache(%r)' % self.db
+
+    def _stamp(self, key):
+        """ 
+            Returns the (inode, mtime, ctime, size) of the file for key, 
+            or None. 
+        """
+        try:
+            st = os.stat(self.db.filename_for_key(key))
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime, st.st_ctime, st.st_size)
+
+    def __getitem__(self, key):
+        # taken before reading: if the file changes meanwhile, the
+        # value is read again next time
+        stamp = self._stamp(key)
+        if key in self.cache:
+            cached_stamp, s = self.cache[key]
+            if stamp is not None and stamp == cached_stamp:
+                self.hits += 1
+                return pickle.loads(s)
+        self.misses += 1
+        value = self.db[key]
+        self._remember(key, value, stamp)
+        return value
+
+    def __setitem__(self, key, value):
+        self.cache.pop(key, None)
+        self.db[key] = value
+
+    def _remember(self, key, value, stamp):
+        if stamp is None:
+            self.cache.pop(key, None)
+            return
+        try:
+            s = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # the filesystem used a different pickler; just don't cache
+            self.cache.pop(key, None)
+            return
+        self.cache[key] = (stamp, s)
+
+    def __delitem__(self, key):
+        self.cache.pop(key, None)
+        del self.db[key]
+
+    def __contains__(self, key):
+        return key in self.db
+
+    def keys(self):
+        return self.db.keys()
+
+    def reopen_after_fork(self):
+        self.db.reopen_after_fork()
+
+
+class WriteBackCache(object):
+    """
+        An LRU write-back cache in front of any compmake DB, used while
+        the jobs are defined: reads are served from memory after the
+        first one, and writes are delayed until flush(). Which keys
+        exist is also remembered, as it is asked for each job defined.
+
+        A value is written back only if it differs from the one stored
+        in the DB (which is read to compare, as compmake writes the jobs
+        without reading them first), so redefining an unchanged job 
+        graph does not write anything.
+
+        The values are kept pickled (at most max_bytes of them); when
+        the budget is exceeded the least recently used are evicted,
+        writing them back if needed.
+
+        It must be flushed before other processes use the DB, and it
+        must be the only user of the DB until then.
+    """
+
+    def __init__(self, db, max_bytes=512 * 1024 * 1024):
+        self.db = db
+        self.max_bytes = max_bytes
+        # key -> pickled value, in LRU order
+        self._values = OrderedDict()
+        self._nbytes = 0
+        # keys whose value was not written to db yet
+        self._dirty = set()
+        # keys deleted, not deleted from db yet
+        self._deleted = set()
+        # key -> whether it is in db
+        self._in_db = {}
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.writes_avoided = 0
+
+    def __repr__(self):
+        return 'WriteBackCache(%r)' % self.db
+
+    def stats(self):
+        """ Returns a string describing hits and misses. """
+        return ('%d hits, %d misses, %d writes, %d writes avoided' % 
+                (self.hits, self.misses, self.writes, self.writes_avoided))
+
+    def _store(self, key, s):
+        old = self._values.pop(key, None)
+        if old is not None:
+            self._nbytes -= len(old)
+        self._values[key] = s
+        self._nbytes += len(s)
+        while self._nbytes > self.max_bytes and len(self._values) > 1:
+            k, v = self._values.popitem(last=False)
+            self._nbytes -= len(v)
+            if k in self._dirty:
+                self._dirty.remove(k)
+                self._write_back(k, v)
+
+    def _db_contains(self, key):
+        if not key in self._in_db:
+            self._in_db[key] = key in self.db
+        return self._in_db[key]
+
+    def _write_back(self, key, s):
+        """ Writes the pickled value s to db, unless it is already there. """
+        value = pickle.loads(s)
+        if self._db_contains(key):
+            try:
+                old = self.db[key]
+            except Exception:
+                old = None
+            if old is not None and same_value(old, value):
+                self.writes_avoided += 1
+                return
+        self.db[key] = value
+        self._in_db[key] = True
+        self.writes += 1
+
+    def __getitem__(self, key):
+        if key in self._values:
+            self.hits += 1
+            s = self._values.pop(key)
+            self._values[key] = s
+            return pickle.loads(s)
+        if key in self._deleted:
+            raise CompmakeException('Could not find key %r.' % key)
+        self.misses += 1
+        value = self.db[key]
+        try:
+            self._store(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            pass
+        return value
+
+    def __setitem__(self, key, value):
+        try:
+            s = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # let the DB raise a good error, or deal with it
+            self.db[key] = value
+            return
+        self._deleted.discard(key)
+        if self._values.get(key, None) == s:
+            # the same value was read or written before
+            if not key in self._dirty:
+                self.writes_avoided += 1
+            return
+        self._store(key, s)
+        self._dirty.add(key)
+
+    def __delitem__(self, key):
+        if not key in self:
+            msg = 'I expected key %r to exist before deleting' % key
+            raise ValueError(msg)
+        s = self._values.pop(key, None)
+        if s is not None:
+            self._nbytes -= len(s)
+        self._dirty.discard(key)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._values:
+            return True
+        if key in self._deleted:
+            return False
+        return self._db_contains(key)
+
+    def keys(self):
+        keys = set(self.db.keys())
+        keys.update(self._dirty)
+        keys.difference_update(self._deleted)
+        return sorted(keys)
+
+    def flush(self):
+        """ Writes all pending changes to the DB. """
+        for key in self._deleted:
+            if self._db_contains(key):
+                del self.db[key]
+                self._in_db[key] = False
+        self._deleted.clear()
+        for key in sorted(self._dirty):
+            self._write_back(key, self._values[key])
+        self._dirty.clear()
+
+    def reopen_after_fork(self):
+        self.db.reopen_after_fork()
+
+
+def same_value(a, b):
+    """ 
+        Returns True if the two values are equal, comparing the 
+        attributes of the objects (a pickled Job, for example, compares 
+        equal to another one with the same id); False if unsure. 
+    """
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, (types.FunctionType, types.BuiltinFunctionType, 
+                      types.MethodType, types.ModuleType, type, 
+                      types.ClassType)):
+        return a == b
+    if isinstance(a, dict):
+        if set(a) != set(b):
+            return False
+        if not all(same_value(a[k], b[k]) for k in a):
+            return False
+    elif isinstance(a, (list, tuple)):
+        if len(a) != len(b):
+            return False
+        if not all(same_value(x, y) for x, y in zip(a, b)):
+            return False
+    elif not hasattr(a, '__dict__'):
+        try:
+            return bool(a == b)
+        except Exception:
+            # e.g. numpy arrays
+            return False
+    if hasattr(a, '__dict__'):
+        return same_value(a.__dict__, b.__dict__)
+    return True
+
+
+# name -> description
+storage_types = {
+    'filesystem': 'one gzip-compressed file per key',
+    'filesystem-raw': 'one uncompressed file per key',
+    'filesystem-cached': 'compressed files, cached in memory (write-through)',
+    'sqlite': 'a single SQLite file',
+}
+
+
+# extension of the files of each kind of filesystem DB
+_file_extensions = {'.pickle': 'filesystem-raw', '.pickle.gz': 'filesystem',
+                    '.pickle.codec': '--codec other than "default"'}
+
+
+def warn_other_formats(db):
+    """
+        Logs a warning if the directory of the filesystem DB has files
+        of another kind (e.g. written before --codec was changed): 
+        they are not read, so the jobs are done again.
+    """
+    if not os.path.exists(db.basepath):
+        return
+    found = {}
+    for name in os.listdir(db.basepath):
+        for ext in _file_extensions:
+            if name.endswith(ext) and ext != db.file_extension:
+                found[ext] = found.get(ext, 0) + 1
+    for ext, n in sorted(found.items()):
+        msg = ('The DB in %r has %d files written with %s (%s); they are '
+               'ignored, so those jobs will be done again. Use the same '
+               'storage and codec as before to reuse them.' % 
+               (db.basepath, n, _file_extensions[ext], ext))
+        logger.warning(msg)
+
+
+@contract(storage_type='str', dirname='str', codec='None|isinstance(Codec)')
+def get_storage(storage_type, dirname, codec=None):
+    """ 
+        Returns the compmake DB of the given type stored in dirname.
+        
+        If a Codec is given, it is used instead of the default compression
+        (gzip for the filesystem, none for SQLite). 
+    """
+    def filesystem():
+        if codec is None:
+            db = StorageFilesystem(dirname, compress=True)
+        else:
+            db = StorageCodec(dirname, codec)
+        warn_other_formats(db)
+        return db
+
+    if storage_type == 'filesystem':
+        return filesystem()
+    elif storage_type == 'filesystem-raw':
+        if codec is not None:
+            msg = 'The storage "filesystem-raw" does not use a codec.'
+            raise ValueError(msg)
+        db = StorageFilesystem(dirname, compress=False)
+        warn_other_formats(db)
+        return db
+    elif storage_type == 'filesystem-cached':
+        return MemoryCache(filesystem())
+    elif storage_type == 'sqlite':
+        return StorageSQLite(os.path.join(dirname, 'compmake.sqlite'), codec)
+    else:
+        msg = 'Unknown storage type %r; available: %s' % (storage_type,
+                                                          sorted(storage_types))
+        raise ValueError(msg)
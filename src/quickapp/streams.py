@@ -0,0 +1,80 @@
+"""
+    Job results that are streams of items, saved in chunks as they are
+    produced (see CompmakeContext.comp_stream).
+"""
+from contracts import contract
+import cPickle as pickle
+import os
+import shutil
+
+__all__ = ['StreamHandle', 'save_stream']
+
+
+class StreamHandle(object):
+    """
+        The result of a job defined with comp_stream: an iterable over the
+        items, reading one chunk at a time from the directory.
+    """
+
+    @contract(dirname='str', nchunks='int,>=0', nitems='int,>=0')
+    def __init__(self, dirname, nchunks, nitems):
+        self.dirname = dirname
+        self.nchunks = nchunks
+        self.nitems = nitems
+
+    def __repr__(self):
+        return 'StreamHandle(%r, %d items)' % (self.dirname, self.nitems)
+
+    def __len__(self):
+        return self.nitems
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            for item in chunk:
+                yield item
+
+    def iter_chunks(self):
+        """ Iterates over the chunks (lists of items). """
+        for i in range(self.nchunks):
+            with open(chunk_filename(self.dirname, i), 'rb') as f:
+                yield pickle.load(f)
+
+
+def chunk_filename(dirname, i):
+    return os.path.join(dirname, 'chunk-%05d.pickle' % i)
+
+
+def save_stream(dirname, chunk_size, f, args, kwargs):
+    """
+        Calls the generator f and saves the items in chunks of chunk_size
+        items in dirname. Returns a StreamHandle.
+    """
+    # write in a temporary directory, then replace the old one
+    tmp = '%s.tmp%s' % (dirname.rstrip('/'), os.getpid())
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    nchunks = 0
+    nitems = 0
+    chunk = []
+
+    def write_chunk():
+        with open(chunk_filename(tmp, nchunks), 'wb') as fo:
+            pickle.dump(chunk, fo, pickle.HIGHEST_PROTOCOL)
+
+    for item in f(*args, **kwargs):
+        chunk.append(item)
+        nitems += 1
+        if len(chunk) == chunk_size:
+            write_chunk()
+            nchunks += 1
+            chunk = []
+    if chunk:
+        write_chunk()
+        nchunks += 1
+
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.rename(tmp, dirname)
+    return StreamHandle(dirname, nchunks, nitems)
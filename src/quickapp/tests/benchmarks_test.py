@@ -0,0 +1,20 @@
+from quickapp.benchmarks.definition import benchmark_definition
+from quickapp.benchmarks.subtask_options import (from_dict, from_args, 
+    throughput)
+from unittest.case import TestCase
+
+
+class BenchmarksTest(TestCase):
+
+    def definition_test(self):
+        for storage in ['memory', 'filesystem']:
+            results = benchmark_definition(jobs=20, depth=2, reports=5,
+                                           resources=3, storage=storage,
+                                           use_contracts=True)
+            self.assertEqual([r['phase'] for r in results],
+                             ['define', 'finalize'])
+            self.assertTrue(0 < results[0]['db_bytes'] < results[1]['db_bytes'])
+
+    def subtask_options_test(self):
+        for f in [from_dict, from_args]:
+            self.assertTrue(throughput(f, 10) > 0)
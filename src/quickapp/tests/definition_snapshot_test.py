@@ -0,0 +1,80 @@
+from quickapp import QuickApp, quickapp_main
+from unittest.case import TestCase
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+
+
+def f(x):
+    return x * 2
+
+
+definitions = []
+
+
+def definition_fingerprint_of(snapshot):
+    with open(snapshot, 'rb') as f:
+        return pickle.load(f)['fingerprint']
+
+
+class QuickAppSnapshot(QuickApp):
+
+    cmd = 'quick-app-snapshot'
+
+    def define_options(self, params):
+        params.add_int('n', help='Number of jobs', default=3)
+
+    def define_jobs_context(self, context):
+        definitions.append(self.get_options().n)
+        for i in range(self.get_options().n):
+            context.comp(f, i)
+
+
+class DefinitionSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        del definitions[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_app(self, *args):
+        args = ['-o', self.tmpdir] + list(args)
+        ret = quickapp_main(QuickAppSnapshot, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+
+    def snapshot_test(self):
+        self.run_app('-c', 'make', '--definition_snapshot')
+        self.assertEqual(definitions, [3])
+        # same options (the command does not matter): nothing is defined
+        self.run_app('-c', 'make', '--definition_snapshot')
+        self.run_app('-c', 'ls', '--definition_snapshot')
+        self.assertEqual(definitions, [3])
+        # different options
+        self.run_app('-c', 'make', '--n', '4', '--definition_snapshot')
+        self.assertEqual(definitions, [3, 4])
+        # the snapshot is used only if asked
+        self.run_app('-c', 'make', '--n', '4')
+        self.assertEqual(definitions, [3, 4, 4])
+
+    def sources_test(self):
+        self.run_app('-c', 'make', '--definition_snapshot')
+        snapshot = os.path.join(self.tmpdir, 'definition-snapshot.pickle')
+        with open(snapshot, 'rb') as f:
+            sources = pickle.load(f)['sources']
+        # the modules of all packages are included, not only the app's
+        self.assertTrue(any('compmake' in x for x in sources))
+        self.assertTrue(os.path.realpath(__file__.replace('.pyc', '.py')) 
+                        in sources)
+        self.assertFalse(os.path.realpath(os.__file__.replace('.pyc', '.py')) 
+                         in sources)
+        # a changed source invalidates the snapshot
+        sources[sorted(sources)[0]] = 'changed'
+        data = dict(fingerprint=definition_fingerprint_of(snapshot),
+                    job_ids=[], sources=sources)
+        with open(snapshot, 'wb') as f:
+            pickle.dump(data, f)
+        self.run_app('-c', 'make', '--definition_snapshot')
+        self.assertEqual(definitions, [3, 3])
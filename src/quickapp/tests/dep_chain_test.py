@@ -0,0 +1,80 @@
+from compmake import Promise, set_compmake_db
+from compmake.jobs import get_job
+from quickapp import CompmakeContext
+from quickapp.dep_chain import DepChain
+from unittest.case import TestCase
+import shutil
+import tempfile
+
+
+def f(x):
+    return x
+
+
+class DepChainTest(TestCase):
+
+    def dep_chain_test(self):
+        a, b, c = Promise('a'), Promise('b'), Promise('c')
+        chain0 = DepChain().extend([a, b, a])
+        self.assertEqual([p.job_id for p in chain0.as_list()], ['a', 'b'])
+        # nothing new: the same chain is returned
+        self.assertTrue(chain0.extend([b]) is chain0)
+        self.assertTrue(chain0.extend([]) is chain0)
+
+        chain1 = chain0.extend([c, b])
+        self.assertEqual([p.job_id for p in chain1.as_list()], ['a', 'b', 'c'])
+        self.assertEqual(len(chain1), 3)
+        # the original chain is not modified
+        self.assertEqual(len(chain0), 2)
+        self.assertRaises(ValueError, chain0.extend, ['d'])
+        self.assertEqual(chain1.job_ids(), frozenset(['a', 'b', 'c']))
+        self.assertTrue(chain1.contains('a'))
+        self.assertFalse(chain0.contains('c'))
+
+    def long_chain_test(self):
+        chain = DepChain()
+        for i in range(1000):
+            chain = chain.extend([Promise('j%d' % i), Promise('j0')])
+        self.assertEqual(len(chain), 1000)
+        # each node keeps only its own ids, not those of its ancestors
+        self.assertEqual(len(chain._ids), 1)
+        self.assertTrue(chain._parent._list is None)
+        self.assertEqual(chain.as_list()[-1].job_id, 'j999')
+
+    def context_test(self):
+        set_compmake_db({})
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        context = CompmakeContext(qapp=None, parent=None, job_prefix='dc',
+                                  output_dir=tmpdir)
+        a = context.comp(f, 1)
+        c1 = context.child('c1', extra_dep=[a])
+        c2 = c1.child('c2', extra_dep=[a])
+        b = c2.comp(f, 2)
+        self.assertEqual(get_job(b.job_id).children, [a.job_id])
+
+        cp = c2.checkpoint('dc-cp')
+        d = c2.comp(f, 3)
+        self.assertEqual(get_job(d.job_id).children, [cp.job_id])
+        # the parent is not affected
+        e = c1.comp(f, 4)
+        self.assertEqual(get_job(e.job_id).children, [a.job_id])
+
+    def checkpoint_frontier_test(self):
+        set_compmake_db({})
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        context = CompmakeContext(qapp=None, parent=None, job_prefix='fr',
+                                  output_dir=tmpdir)
+        a = context.comp(f, 1)
+        b = context.comp(f, [a])
+        c = context.comp(f, 2)
+        cp1 = context.checkpoint('cp1')
+        self.assertEqual(sorted(get_job(cp1.job_id).children),
+                         sorted([b.job_id, c.job_id]))
+        d = context.comp(f, 3)
+        cp2 = context.checkpoint('cp2')
+        # only d is in the frontier, as it depends on cp1
+        self.assertEqual(sorted(get_job(cp2.job_id).children),
+                         sorted([cp1.job_id, d.job_id]))
+        self.assertEqual(context._frontier.keys(), [cp2.job_id])
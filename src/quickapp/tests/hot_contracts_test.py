@@ -0,0 +1,35 @@
+from contracts import (ContractNotRespected, all_disabled, enable_all,
+    disable_all)
+from quickapp.utils.hot_contracts import (contract_hot, strip_hot_contracts,
+    restore_hot_contracts)
+from unittest.case import TestCase
+
+
+class Example(object):
+
+    @contract_hot(x='int')
+    def f(self, x):
+        return x
+
+
+class HotContractsTest(TestCase):
+
+    def strip_test(self):
+        # other tests might have disabled the checks
+        was_disabled = all_disabled()
+        enable_all()
+        try:
+            self._check_strip()
+        finally:
+            if was_disabled:
+                disable_all()
+
+    def _check_strip(self):
+        self.assertRaises(ContractNotRespected, Example().f, 'a')
+        strip_hot_contracts(Example)
+        try:
+            self.assertEqual(Example().f('a'), 'a')
+            self.assertFalse(hasattr(Example.__dict__['f'], '__undecorated__'))
+        finally:
+            restore_hot_contracts()
+        self.assertRaises(ContractNotRespected, Example().f, 'a')
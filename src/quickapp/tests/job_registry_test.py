@@ -0,0 +1,26 @@
+from compmake import Promise
+from quickapp.job_registry import JobRegistry
+from unittest.case import TestCase
+
+
+class JobRegistryTest(TestCase):
+
+    def views_test(self):
+        registry = JobRegistry()
+        root = registry.new_view()
+        sub = registry.new_view()
+        subsub = registry.new_view()
+        root.register(Promise('a'))
+        sub.register(Promise('b'))
+        subsub.register(Promise('c'))
+        sub.attach(subsub)
+        root.attach(sub)
+        # attaching twice does not duplicate
+        root.attach(subsub)
+        subsub.register(Promise('d'))
+
+        self.assertEqual(list(root.job_ids()), ['a', 'b', 'c', 'd'])
+        self.assertEqual(list(sub.job_ids()), ['b', 'c', 'd'])
+        self.assertEqual(sorted(root.as_dict()), ['a', 'b', 'c', 'd'])
+        self.assertEqual(len(registry), 4)
+        self.assertRaises(ValueError, root.attach, JobRegistry().new_view())
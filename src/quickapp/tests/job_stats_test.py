@@ -0,0 +1,109 @@
+from compmake.jobs import get_job
+from compmake.state import get_compmake_db
+from compmake.ui.ui import reset_jobs_definition_set
+from quickapp import QuickApp, quickapp_main
+from quickapp.job_registry import JobRegistry
+from quickapp.job_stats import aggregate_job_stats, ROOT
+from reprep import Report
+from unittest.case import TestCase
+import json
+import os
+import shutil
+import tempfile
+
+
+def make_data(n):
+    return range(n)
+
+
+def make_report(data):
+    r = Report()
+    r.text('n', '%d' % len(data))
+    return r
+
+
+class QuickAppStats(QuickApp):
+
+    cmd = 'quick-app-stats'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        for name in ['small', 'large']:
+            c = context.child(name)
+            data = c.comp(make_data, 10 if name == 'small' else 100000)
+            c.add_report(c.comp(make_report, data), 'r', name=name)
+
+
+class JobStatsTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        reset_jobs_definition_set()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def aggregate_test(self):
+        registry = JobRegistry()
+        registry.new_view('a', None)
+        registry.new_view('a-b', 'a')
+        registry.prefixes.update({'x': None, 'a-y': 'a', 'a-b-z': 'a-b'})
+        jobs = [dict(job_id=job_id, prefix=registry.prefixes[job_id],
+                     walltime=1.0, cputime=0.5, result_bytes=10, rss_delta=r)
+                for job_id, r in [('x', None), ('a-y', 2.0), ('a-b-z', 3.0)]]
+        jobs[1]['cputime'] = None
+        totals = aggregate_job_stats(registry, jobs)
+        self.assertEqual(sorted(totals), [ROOT, 'a', 'a-b'])
+        self.assertEqual(totals[ROOT]['jobs'], 3)
+        self.assertEqual(totals[ROOT]['missing'], 2)
+        self.assertEqual(totals[ROOT]['cputime'], 1.0)
+        self.assertEqual(totals[ROOT]['rss_delta'], 3.0)
+        self.assertEqual(totals['a-b']['missing'], 0)
+        self.assertEqual(totals[ROOT]['result_bytes'], 30)
+        self.assertEqual(totals['a']['walltime'], 2.0)
+        self.assertEqual(totals['a']['rss_delta'], 3.0)
+        self.assertEqual(totals['a-b']['jobs'], 1)
+
+    def app_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make', '--stats']
+        ret = quickapp_main(QuickAppStats, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        with open(os.path.join(self.tmpdir, 'stats', 'stats.json')) as f:
+            stats = json.load(f)
+        contexts = stats['contexts']
+        self.assertEqual(contexts[ROOT]['jobs'], 4)
+        self.assertTrue(contexts['large']['result_bytes'] >
+                        contexts['small']['result_bytes'])
+        jobs = dict((j['job_id'], j) for j in stats['jobs'])
+        # the job ids are the same as without --stats
+        self.assertEqual(sorted(jobs), ['large-make_data', 'large-make_report',
+                                        'small-make_data', 'small-make_report'])
+        self.assertTrue(jobs['large-make_data']['rss_delta'] is not None)
+        with open(os.path.join(self.tmpdir, 'reports.html')) as f:
+            self.assertTrue('stats/stats.html' in f.read())
+        # the measurements are not in the compmake DB
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'stats',
+                                        'jobs', 'large-make_data.pickle')))
+        db = get_compmake_db()
+        self.assertEqual([k for k in db.keys() if 'quickapp' in k], [])
+        # the jobs show the user's function
+        self.assertEqual(get_job('large-make_data').command_desc, 'make_data')
+
+    def done_before_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        self.assertEqual(quickapp_main(QuickAppStats, args, sys_exit=False), 0)
+        # as if in another process
+        reset_jobs_definition_set()
+        args = ['-o', self.tmpdir, '-c', 'make', '--stats']
+        self.assertEqual(quickapp_main(QuickAppStats, args, sys_exit=False), 0)
+        with open(os.path.join(self.tmpdir, 'stats', 'stats.json')) as f:
+            stats = json.load(f)
+        jobs = dict((j['job_id'], j) for j in stats['jobs'])
+        # done without measuring: missing, not 0
+        self.assertEqual(jobs['large-make_data']['rss_delta'], None)
+        self.assertEqual(stats['contexts'][ROOT]['missing'], 4)
+        # the link is added even if the index job was already done
+        with open(os.path.join(self.tmpdir, 'reports.html')) as f:
+            self.assertTrue('stats/stats.html' in f.read())
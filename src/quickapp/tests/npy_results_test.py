@@ -0,0 +1,61 @@
+from quickapp import QuickApp, quickapp_main
+from quickapp.npy_results import NpyArray, save_npy_result
+from unittest.case import TestCase
+import cPickle as pickle
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+def make_arrays(n):
+    return dict(large=np.arange(n, dtype='float64'), small=np.zeros(2))
+
+
+def check_arrays(arrays):
+    assert isinstance(arrays['large'], NpyArray), type(arrays['large'])
+    assert not isinstance(arrays['small'], NpyArray)
+    return float(arrays['large'].sum())
+
+
+class QuickAppNpy(QuickApp):
+
+    cmd = 'quick-app-npy'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        arrays = context.comp_npy(make_arrays, 1000, npy_threshold=100)
+        context.comp(check_arrays, arrays)
+
+
+class NpyResultsTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def pickling_test(self):
+        res = save_npy_result(self.tmpdir, 'job', 100, make_arrays, [1000], {})
+        large = res['large']
+        self.assertTrue(isinstance(large, NpyArray))
+        s = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
+        # only a reference to the file
+        self.assertTrue(len(s) < 1000)
+        res2 = pickle.loads(s)
+        self.assertEqual(res2['large'].npy_filename, large.npy_filename)
+        self.assertTrue(np.all(res2['large'] == np.arange(1000)))
+        # derived arrays are pickled normally
+        part = pickle.loads(pickle.dumps(large[10:20], pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(type(part), np.ndarray)
+        self.assertEqual(list(part), range(10, 20))
+
+    def app_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        ret = quickapp_main(QuickAppNpy, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        files = os.listdir(os.path.join(self.tmpdir, 'npy'))
+        self.assertEqual(files, ['make_arrays-0.npy'])
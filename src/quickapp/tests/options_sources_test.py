@@ -0,0 +1,44 @@
+from quickapp import QuickApp
+from unittest.case import TestCase
+import json
+import os
+import shutil
+import tempfile
+
+
+class QuickAppSources(QuickApp):
+
+    cmd = 'quick-app-sources'
+    env_prefix = 'QAS_'
+
+    def define_options(self, params):
+        params.add_int('a', default=0)
+        params.add_int('b', default=0)
+        params.add_int('c', default=0)
+
+    def define_jobs_context(self, context):
+        pass
+
+
+class OptionsSourcesTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        os.environ.pop('QAS_B', None)
+
+    def precedence_test(self):
+        filename = os.path.join(self.tmpdir, 'options.json')
+        with open(filename, 'w') as f:
+            json.dump(dict(a=1, b=1, c=1), f)
+        os.environ['QAS_B'] = '2'
+        app = QuickAppSources()
+        app.set_options_from_args(['-o', self.tmpdir, '--options_file', filename,
+                                   '--c', '3'])
+        options = app.get_options()
+        self.assertEqual((options.a, options.b, options.c), (1, 2, 3))
+        # the values read are cached in the output dir
+        cache_dir = os.path.join(self.tmpdir, 'options-cache')
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
@@ -0,0 +1,47 @@
+from decent_params import DecentParams
+from quickapp import QuickAppBase
+from quickapp.quick_app_base import _parsers
+from unittest.case import TestCase
+
+
+class AppParsed(QuickAppBase):
+    """ An app whose options depend on the instance. """
+
+    cmd = 'app-parsed'
+
+    def __init__(self, nparams=1):
+        QuickAppBase.__init__(self)
+        self.nparams = nparams
+
+    def define_program_options(self, params):
+        for i in range(self.nparams):
+            params.add_int('p%d' % i, default=i)
+
+    def go(self):
+        pass
+
+
+class ParserCacheTest(TestCase):
+
+    def parser_reused_test(self):
+        a = AppParsed()
+        a.set_options_from_args(['--p0', '3'])
+        parser = _parsers[AppParsed][1]
+        b = AppParsed()
+        b.set_options_from_args([])
+        self.assertTrue(_parsers[AppParsed][1] is parser)
+        self.assertEqual((a.get_options().p0, b.get_options().p0), (3, 0))
+        # a different spec invalidates the cache
+        c = AppParsed(nparams=2)
+        c.set_options_from_args(['--p1', '5'])
+        self.assertFalse(_parsers[AppParsed][1] is parser)
+        self.assertEqual(c.get_options().p1, 5)
+
+    def extra_reused_test(self):
+        params = DecentParams()
+        params.add_int('a', default=0)
+        params.accept_extra()
+        parser = params.create_parser()
+        for extra in [['x'], ['y', 'z']]:
+            dpr = params.get_dpr_from_args(['--a', '1'] + extra, parser=parser)
+            self.assertEqual((dpr.a, dpr.get_extra()), (1, extra))
@@ -0,0 +1,310 @@
+from compmake.jobs import all_jobs
+from compmake.jobs.storage import get_job_args
+from quickapp import QuickApp, quickapp_main
+from quickapp.report_manager import (batch_bucket, manifest_append, manifest_read,
+    write_index_from_manifest, index_reports, get_most_similar,
+    get_most_similar_all, VariationsIndex, write_shared_artifact,
+    read_shared_artifact, open_index_page, write_reports_batch)
+from reprep import Report
+from reprep.report_utils import StoreResults
+from unittest.case import TestCase
+import os
+import random
+import shutil
+import tempfile
+
+
+def make_report(i, kind):
+    r = Report()
+    r.text('i', '%s %s' % (kind, i))
+    return r
+
+
+class QuickAppReports(QuickApp):
+
+    cmd = 'quick-app-reports'
+
+    def define_options(self, params):
+        params.add_int('n', help='Number of reports', default=3)
+        params.add_int('batch', help='Number of jobs writing the reports', 
+                       default=0)
+
+    def define_jobs_context(self, context):
+        options = self.get_options()
+        if options.batch:
+            context.get_report_manager().set_write_batch(options.batch, processes=2)
+        for i in range(options.n):
+            for kind in ['a', 'b']:
+                r = context.comp(make_report, i, kind)
+                context.add_report(r, 'report_%s' % kind, i=i)
+
+
+def index(x):
+    return x
+
+
+class QuickAppSeparateReports(QuickApp):
+
+    cmd = 'quick-app-separate-reports'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        # a job that has the name of the old index job
+        context.comp(index, 1)
+        c = context.child('sub', add_job_prefix='', 
+                          separate_report_manager=True)
+        c.add_report(c.comp(make_report, 0, 'a'), 'report_a', i=0)
+        # as for a subtask
+        c.finalize_jobs()
+        context.add_report(context.comp(make_report, 1, 'a'), 'report_a', i=1)
+
+
+class ReportManagerTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def reports_app_batch_test(self):
+        outdir = os.path.join(self.tmpdir, 'out')
+        args = ['-o', outdir, '-c', 'make', '--n', '5', '--batch', '4']
+        ret = quickapp_main(QuickAppReports, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+
+        mtimes = manifest_read(os.path.join(outdir, 'reports.manifest'))
+        self.assertEqual(len(mtimes), 10)
+        html = open(os.path.join(outdir, 'reports.html')).read()
+        self.assertFalse('missing' in html)
+        # the batches are named after their bucket
+        batches = [j for j in all_jobs() if 'batch' in j]
+        self.assertTrue(len(batches) > 1)
+        self.assertTrue(set(batches) <= 
+                        set('reports-batch%d' % k for k in range(4)))
+        self.assertTrue('index-reports' in all_jobs())
+
+    def batches_stable_test(self):
+        outdir = os.path.join(self.tmpdir, 'out')
+
+        def batches(n):
+            args = ['-o', outdir, '-c', 'ls', '--n', str(n), '--batch', '4']
+            ret = quickapp_main(QuickAppReports, args, sys_exit=False)
+            self.assertEqual(ret, 0)
+            # batch -> reports in it
+            return dict((j, set(w['report_html'] 
+                                for w in get_job_args(j)[2]['writes'])) 
+                        for j in all_jobs() if 'batch' in j)
+
+        # 12 and 14 reports (with batches of 4, the count would change)
+        before = batches(6)
+        after = batches(7)
+        # the reports stay in their batch; only the new ones are added
+        new = set.union(*after.values()) - set.union(*before.values())
+        self.assertEqual(len(new), 2)
+        for j in after:
+            self.assertEqual(after[j] - new, before.get(j, set()))
+
+    def batch_errors_test(self):
+        # the arguments are missing: each write fails in the pool
+        writes = [dict(report_html='a.html'), dict(report_html='b.html')]
+        try:
+            write_reports_batch(writes, processes=2)
+        except Exception as e:
+            msg = str(e)
+        else:
+            self.fail()
+        self.assertTrue('Could not write 2 of 2' in msg)
+        # with the traceback from the worker
+        self.assertTrue('Traceback' in msg)
+        self.assertTrue('TypeError' in msg)
+
+    def separate_report_manager_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        ret = quickapp_main(QuickAppSeparateReports, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        jobs = all_jobs()
+        self.assertTrue('index' in jobs)
+        self.assertTrue('index-reports' in jobs)
+        self.assertTrue('index-sub_reports' in jobs)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'sub', 
+                                                    'reports.html')))
+
+    def open_index_page_test(self):
+        page = os.path.join(self.tmpdir, 'page.html')
+        with open_index_page(page) as f:
+            f.write('first')
+        try:
+            with open_index_page(page) as f:
+                f.write('second')
+                raise ValueError()
+        except ValueError:
+            pass
+        # the page is not touched and the temporary file is removed
+        self.assertTrue('first' in open(page).read())
+        self.assertEqual(os.listdir(self.tmpdir), ['page.html'])
+
+    def batch_bucket_test(self):
+        job_ids = ['r%d-write' % i for i in range(100)]
+        buckets = [batch_bucket(j, 7) for j in job_ids]
+        self.assertEqual(set(buckets), set(range(7)))
+        # it does not depend on the other reports
+        self.assertEqual(batch_bucket('r5-write', 7), buckets[5])
+
+    def manifest_test(self):
+        manifest = os.path.join(self.tmpdir, 'index.manifest')
+        self.assertEqual(manifest_read(manifest), {})
+
+        filenames = []
+        for i in range(3):
+            filename = os.path.join(self.tmpdir, 'r%d.html' % i)
+            open(filename, 'w').write('report')
+            manifest_append(manifest, filename=filename)
+            filenames.append(filename)
+        # a record for the same file is appended again
+        manifest_append(manifest, filename=filenames[0])
+
+        mtimes = manifest_read(manifest)
+        self.assertEqual(sorted(mtimes), filenames)
+
+        reports = StoreResults()
+        reports[dict(report='r', i=0)] = filenames[0]
+        reports[dict(report='r', i=1)] = filenames[1]
+        index = os.path.join(self.tmpdir, 'index.html')
+        handle = write_shared_artifact(os.path.join(self.tmpdir, 'reports.pickle'),
+                                       reports)
+        write_index_from_manifest(handle, index, manifest)
+        self.assertTrue(os.path.exists(index))
+        # the manifest has been compacted
+        self.assertEqual(sorted(manifest_read(manifest)), filenames[:2])
+
+    def reports_app_test(self):
+        outdir = os.path.join(self.tmpdir, 'out')
+        args = ['-o', outdir, '-c', 'make', '--n', '3']
+        ret = quickapp_main(QuickAppReports, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+
+        index = os.path.join(outdir, 'reports.html')
+        self.assertTrue(os.path.exists(index))
+        mtimes = manifest_read(os.path.join(outdir, 'reports.manifest'))
+        self.assertEqual(len(mtimes), 6)
+        html = open(index).read()
+        self.assertFalse('missing' in html)
+
+    def shared_artifact_test(self):
+        filename = os.path.join(self.tmpdir, 'a', 'shared.pickle')
+        reports = StoreResults()
+        reports[dict(report='r', i=0)] = 'r0.html'
+        self.assertEqual(write_shared_artifact(filename, reports), filename)
+        os.utime(filename, (1000, 1000))
+        # same contents: the file is not touched
+        write_shared_artifact(filename, reports)
+        self.assertEqual(os.path.getmtime(filename), 1000)
+        # new reports are added
+        reports[dict(report='r', i=1)] = 'r1.html'
+        write_shared_artifact(filename, reports)
+        self.assertEqual(read_shared_artifact(filename), reports)
+
+    def sharded_index_test(self):
+        reports = StoreResults()
+        for report_type in ['a', 'b']:
+            for i in range(4):
+                for j in range(3):
+                    filename = os.path.join(self.tmpdir, 'reports', report_type,
+                                            '%s-%s.html' % (i, j))
+                    reports[dict(report=report_type, i=i, j=j)] = filename
+        index = os.path.join(self.tmpdir, 'index.html')
+        index_reports(reports, index, mtimes={}, max_reports_per_page=5)
+
+        shards = os.path.join(self.tmpdir, 'index-index')
+        pages = sorted(os.listdir(shards))
+        # one page per type, then one per value of the field with least choices
+        self.assertTrue('report=a.html' in pages)
+        self.assertTrue('report=b.html' in pages)
+        self.assertEqual(len(pages), 2 + 2 * 3)
+        html = open(index).read()
+        self.assertTrue('index-index/report=a.html' in html)
+        self.assertFalse('reports/a/0-0.html' in html)
+        page_a = open(os.path.join(shards, 'report=a.html')).read()
+        self.assertTrue('../index.html' in page_a)
+        sub = open(os.path.join(shards, 'report=a-j=0.html')).read()
+        self.assertTrue('../reports/a/3-0.html' in sub)
+
+        # small collections are indexed in a single page
+        index2 = os.path.join(self.tmpdir, 'index2.html')
+        index_reports(reports, index2, mtimes={}, max_reports_per_page=100)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'index2-index')))
+        self.assertTrue('reports/a/0-0.html' in open(index2).read())
+
+        # the anchors are the same as in the unsharded index
+        self.assertTrue('id="a-0"' in open(index2).read())
+        self.assertTrue('id="a-0"' in page_a)
+
+        # fewer reports: the pages not written anymore are removed
+        reports = reports.select(report='a')
+        index_reports(reports, index, mtimes={}, max_reports_per_page=5)
+        self.assertEqual(sorted(os.listdir(shards)),
+                         ['report=a-j=%d.html' % j for j in range(3)] + 
+                         ['report=a.html'])
+        index_reports(reports, index, mtimes={}, max_reports_per_page=100)
+        self.assertEqual(os.listdir(shards), [])
+
+    def sharded_index_recursive_test(self):
+        # too many values for a single page, even as links
+        reports = StoreResults()
+        for i in range(30):
+            filename = os.path.join(self.tmpdir, 'reports', '%s.html' % i)
+            reports[dict(report='a', i=i)] = filename
+        index = os.path.join(self.tmpdir, 'index.html')
+        index_reports(reports, index, mtimes={}, max_reports_per_page=4)
+        shards = os.path.join(self.tmpdir, 'index-index')
+        for name in os.listdir(shards):
+            html = open(os.path.join(shards, name)).read()
+            self.assertTrue(html.count('<li') <= 4, name)
+        # all reports are reachable
+        html = ''.join(open(os.path.join(shards, name)).read() 
+                       for name in os.listdir(shards))
+        for i in range(30):
+            self.assertTrue('../reports/%s.html' % i in html)
+
+    def most_similar_all_test(self):
+        rng = random.Random(0)
+        type2reports = {}
+        for report_type, fields in [('a', ['x', 'y']), ('b', ['x', 'y', 'z']),
+                                    ('c', ['z'])]:
+            reports = StoreResults()
+            for _ in range(30):
+                key = dict((f, rng.choice([0, 1, 2, 'u', 'v'])) for f in fields)
+                reports[key] = '%s-%s' % (report_type, sorted(key.items()))
+            type2reports[report_type] = reports
+
+        type2others = get_most_similar_all(type2reports)
+        for report_type, reports in type2reports.items():
+            for key in reports:
+                expected = []
+                for other_type, other_reports in type2reports.items():
+                    if other_type == report_type:
+                        continue
+                    best = get_most_similar(other_reports, key)
+                    if best is not None:
+                        expected.append((other_type, best, other_reports[best]))
+                found = type2others[report_type][key]
+                self.assertEqual(sorted(found), sorted(expected))
+
+    def variations_index_test(self):
+        reports = StoreResults()
+        for i in range(3):
+            for j in ['x', 'y']:
+                if (i, j) == (2, 'y'):
+                    continue
+                reports[dict(i=i, j=j)] = 'reports/r/r-%s-%s.html' % (i, j)
+        index = VariationsIndex(reports)
+        table = dict(index.links_table(dict(i=1, j='y')))
+        self.assertEqual(sorted(table), ['i', 'j'])
+        self.assertEqual(table['i'], [(0, 'r-0-y.html'),
+                                      ('<span style="font-weight:bold">1</span>', None),
+                                      ('2 (n/a)', None)])
+        self.assertEqual(table['j'], [('x', 'r-1-x.html'),
+                                      ('<span style="font-weight:bold">y</span>', None)])
@@ -0,0 +1,153 @@
+from quickapp import QuickApp, quickapp_main
+from quickapp.resource_graph import ResourceGraph
+from unittest.case import TestCase
+import json
+import os
+import shutil
+import tempfile
+
+
+def make_small(x):
+    return ('small', x)
+
+
+def make_large(x):
+    return ('large', x)
+
+
+def use(a, b):
+    return [a, b]
+
+
+calls = []
+
+
+def provide_small(context, x):
+    calls.append(('small', x))
+    return context.comp(make_small, x)
+
+
+def provide_large(context, x):
+    calls.append(('large', x))
+    return context.comp(make_large, x)
+
+provide_large.can_provide = lambda x: x >= 5
+
+
+class QuickAppResources(QuickApp):
+
+    cmd = 'quick-app-resources'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        rm = context.get_resource_manager()
+        rm.set_resource_provider('data', provide_small,
+                                 can_provide=lambda x: x < 5)
+        rm.set_resource_provider('data', provide_large)
+
+        for i, x in enumerate([1, 7, 1, 7]):
+            c = context.child('use%s' % i)
+            c.comp(use, c.get_resource('data', x=x), c.get_resource('data', x=7))
+
+
+def provide_chain(context, x):
+    if x == 0:
+        return context.comp(make_small, x)
+    return context.comp(use, context.get_resource('data', x=x - 1), x)
+
+
+# the graph of each run of QuickAppDeps
+graphs = []
+
+
+class QuickAppDeps(QuickApp):
+
+    cmd = 'quick-app-deps'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        rm = context.get_resource_manager()
+        rm.set_resource_provider('data', provide_chain)
+        context.comp(use, context.get_resource('data', x=2), None)
+        graphs.append(rm.graph)
+
+
+class QuickAppSeparateManagers(QuickApp):
+
+    cmd = 'quick-app-separate-managers'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        for c in [context, context.child('sub', separate_resource_manager=True)]:
+            c.get_resource_manager().set_resource_provider('data', provide_small)
+            c.comp(use, c.get_resource('data', x=0), None)
+
+
+class ResourceManagerTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        del calls[:]
+        del graphs[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def resources_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        ret = quickapp_main(QuickAppResources, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        # each resource is created once, only by the provider that can
+        self.assertEqual(calls, [('small', 1), ('large', 7)])
+
+    def resources_graph_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make', '--resources_graph']
+        ret = quickapp_main(QuickAppDeps, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        data = json.load(open(os.path.join(self.tmpdir, 'resources',
+                                           'resources.json')))
+        edges = sorted(tuple(e) for e in data['edges'])
+        self.assertEqual(edges, [('data(x=1)', 'data(x=0)'),
+                                 ('data(x=2)', 'data(x=1)'),
+                                 ('root', 'data(x=2)')])
+        self.assertEqual(data['critical_path']['nodes'],
+                         ['data(x=2)', 'data(x=1)', 'data(x=0)'])
+        dot = open(os.path.join(self.tmpdir, 'resources', 'resources.dot')).read()
+        # the duration is on a second line of the label
+        self.assertIn('"data(x=0)\\n', dot)
+        self.assertNotIn('\\\\n', dot)
+
+    def separate_managers_graph_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make', '--resources_graph']
+        ret = quickapp_main(QuickAppSeparateManagers, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        data = json.load(open(os.path.join(self.tmpdir, 'resources',
+                                           'resources.json')))
+        # each manager creates its own job, recorded as its own node
+        nodes = dict((n['id'], n['job_id']) for n in data['nodes'])
+        self.assertEqual(sorted(nodes), ['data(x=0)', 'sub:data(x=0)'])
+        self.assertNotEqual(nodes['data(x=0)'], nodes['sub:data(x=0)'])
+
+    def no_resources_graph_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        ret = quickapp_main(QuickAppDeps, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        # nothing is recorded
+        self.assertEqual(graphs, [None])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'resources')))
+
+    def critical_path_test(self):
+        graph = ResourceGraph()
+        graph.nodes = dict(a=dict(job_id='ja'), b=dict(job_id='jb'),
+                           c=dict(job_id='jc'))
+        graph.children = dict(root=set(['a', 'c']), a=set(['b']))
+        total, path = graph.critical_path(dict(ja=1.0, jb=2.0, jc=2.5))
+        self.assertEqual((total, path), (3.0, ['a', 'b']))
+        total, path = graph.critical_path(dict(ja=1.0, jb=2.0, jc=5.0))
+        self.assertEqual((total, path), (5.0, ['c']))
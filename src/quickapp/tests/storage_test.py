@@ -0,0 +1,224 @@
+from compmake.storage.filesystem import StorageFilesystem
+from compmake import comp, set_compmake_db
+from compmake.jobs.storage import get_job_args
+from compmake.structures import CompmakeException, Job
+from compmake.ui.ui import reset_jobs_definition_set
+from quickapp import QuickApp, quickapp_main, logger
+from quickapp.compression import Codec
+from quickapp.storage import (get_storage, storage_types, MemoryCache,
+    WriteBackCache, same_value)
+from unittest.case import TestCase
+import logging
+import os
+import shutil
+import tempfile
+
+
+def f(x):
+    return x * 2
+
+
+def g(a, b):
+    return a + b
+
+
+class QuickAppStorage(QuickApp):
+
+    cmd = 'quick-app-storage'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        a = context.comp(f, 1)
+        b = context.comp(f, 2)
+        context.comp(g, a, b)
+
+
+class StorageTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def storage_types_test(self):
+        for storage_type in storage_types:
+            db = get_storage(storage_type, os.path.join(self.tmpdir, storage_type))
+            self.assertFalse('a' in db)
+            self.assertRaises(CompmakeException, db.__getitem__, 'a')
+            db['a'] = [1, 2]
+            db['b/c'] = dict(x=1)
+            self.assertTrue('a' in db)
+            self.assertEqual(db['a'], [1, 2])
+            # the objects returned can be modified
+            db['a'].append(3)
+            self.assertEqual(db['a'], [1, 2])
+            self.assertEqual(sorted(db.keys()), ['a', 'b/c'])
+            del db['a']
+            self.assertFalse('a' in db)
+            self.assertRaises(ValueError, db.__delitem__, 'a')
+
+    def memory_cache_test(self):
+        dirname = os.path.join(self.tmpdir, 'db')
+        db = MemoryCache(StorageFilesystem(dirname, compress=True))
+        db['a'] = 1
+        self.assertEqual(db['a'], 1)
+        self.assertEqual(db['a'], 1)
+        self.assertEqual((db.hits, db.misses), (1, 1))
+        # another process writes the same key, with a value of the same
+        # size, and the file gets the same mtime
+        filename = db.db.filename_for_key('a')
+        st = os.stat(filename)
+        other = StorageFilesystem(dirname, compress=True)
+        other['a'] = 2
+        os.utime(filename, (st.st_atime, st.st_mtime))
+        self.assertEqual(os.path.getsize(filename), st.st_size)
+        self.assertEqual(db['a'], 2)
+        self.assertEqual(db.misses, 2)
+        # our own writes are read again once
+        db['a'] = 3
+        self.assertEqual(db['a'], 3)
+        self.assertEqual(db.misses, 3)
+
+    def apps_test(self):
+        for storage_type in ['sqlite', 'filesystem-cached', 'filesystem-raw']:
+            outdir = os.path.join(self.tmpdir, storage_type)
+            args = ['-o', outdir, '-c', 'make', '--storage', storage_type]
+            ret = quickapp_main(QuickAppStorage, args, sys_exit=False)
+            self.assertEqual(ret, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'sqlite',
+                                                    'compmake', 'compmake.sqlite')))
+
+    def write_back_cache_test(self):
+        dirname = os.path.join(self.tmpdir, 'db')
+        fs = StorageFilesystem(dirname, compress=False)
+        fs['a'] = 1
+        fs['b'] = 2
+        db = WriteBackCache(fs)
+        self.assertEqual(db['a'], 1)
+        self.assertEqual(db['a'], 1)
+        self.assertEqual((db.hits, db.misses), (1, 1))
+        # an unchanged value is not written again
+        db['a'] = 1
+        self.assertEqual(db.writes_avoided, 1)
+        db['c'] = 3
+        del db['b']
+        self.assertEqual(db.keys(), ['a', 'c'])
+        # nothing is written before flush()
+        self.assertFalse('c' in fs)
+        self.assertTrue('b' in fs)
+        db.flush()
+        self.assertEqual(fs['c'], 3)
+        self.assertFalse('b' in fs)
+
+    def write_back_redefinition_test(self):
+        fs = StorageFilesystem(os.path.join(self.tmpdir, 'db'), compress=True)
+
+        def define():
+            reset_jobs_definition_set()
+            db = WriteBackCache(fs)
+            set_compmake_db(db)
+            a = comp(f, 1, job_id='a')
+            b = comp(f, 2, job_id='b')
+            comp(g, a, b, job_id='c')
+            db.flush()
+            return db
+
+        db = define()
+        self.assertEqual(db.writes_avoided, 0)
+        inodes = dict((k, os.stat(fs.filename_for_key(k)).st_ino) 
+                      for k in fs.keys())
+        # the same jobs again: nothing is written
+        db = define()
+        self.assertEqual(db.writes_avoided, len(inodes))
+        self.assertEqual(db.writes, 0)
+        self.assertEqual(inodes, dict((k, os.stat(fs.filename_for_key(k)).st_ino) 
+                                      for k in fs.keys()))
+        # a changed job is written
+        reset_jobs_definition_set()
+        db = WriteBackCache(fs)
+        set_compmake_db(db)
+        comp(f, 3, job_id='a')
+        db.flush()
+        self.assertEqual(get_job_args('a')[1], [3])
+
+    def same_value_test(self):
+        self.assertTrue(same_value(dict(a=[1, (f, 'x')]), dict(a=[1, (f, 'x')])))
+        self.assertFalse(same_value([f], [g]))
+        self.assertFalse(same_value([1], [1.0]))
+        # not only the job id, as Job.__eq__
+        job1, job2 = Job('a', [], 'f'), Job('a', ['b'], 'f')
+        self.assertFalse(same_value(job1, job2))
+        self.assertTrue(same_value(job1, Job('a', [], 'f')))
+
+    def write_back_cache_eviction_test(self):
+        fs = StorageFilesystem(os.path.join(self.tmpdir, 'db'), compress=False)
+        db = WriteBackCache(fs, max_bytes=100)
+        for i in range(10):
+            db['k%d' % i] = 'x' * 30
+        # the least recently used were written back
+        self.assertTrue('k0' in fs)
+        self.assertFalse('k9' in fs)
+        self.assertEqual(db['k0'], 'x' * 30)
+        db.flush()
+        self.assertEqual(len(fs.keys()), 10)
+
+    def codec_test(self):
+        s = 'abc' * 1000
+        for name in ['none', 'zlib', 'bz2']:
+            codec = Codec(name, level=1)
+            encoded = codec.encode(s)
+            self.assertEqual(codec.decode(encoded), s)
+            # any codec can decode
+            self.assertEqual(Codec('none').decode(encoded), s)
+        codec = Codec('zlib', threshold=100)
+        self.assertEqual(codec.encode('short'), 'nshort')
+        self.assertTrue(len(codec.encode(s)) < 100)
+        self.assertEqual(codec.raw_bytes, len(s) + 5)
+
+        for storage_type in ['filesystem', 'filesystem-cached', 'sqlite']:
+            dirname = os.path.join(self.tmpdir, 'codec-' + storage_type)
+            db = get_storage(storage_type, dirname, codec=Codec('zlib'))
+            db['a'] = s
+            self.assertEqual(db['a'], s)
+            self.assertEqual(db.keys(), ['a'])
+
+    def codec_switch_test(self):
+        s = 'abc' * 1000
+        # sqlite: written with one codec, read with another
+        for write, read in [(Codec('zlib'), None), (None, Codec('bz2')),
+                            (Codec('zlib'), Codec('bz2'))]:
+            dirname = os.path.join(self.tmpdir, 'switch')
+            shutil.rmtree(dirname, ignore_errors=True)
+            get_storage('sqlite', dirname, codec=write)['a'] = s
+            self.assertEqual(get_storage('sqlite', dirname, codec=read)['a'], s)
+
+        # filesystem: the files of the other codec are not read, but we say so
+        dirname = os.path.join(self.tmpdir, 'switch-fs')
+        get_storage('filesystem', dirname)['a'] = s
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+
+        handler = Handler()
+        logger.addHandler(handler)
+        try:
+            db = get_storage('filesystem', dirname, codec=Codec('zlib'))
+        finally:
+            logger.removeHandler(handler)
+        self.assertFalse('a' in db)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue('1 files written with filesystem' in messages[0])
+
+    def codec_app_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make', '--codec', 'bz2',
+                '--codec_threshold', '0']
+        ret = quickapp_main(QuickAppStorage, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        files = os.listdir(os.path.join(self.tmpdir, 'compmake'))
+        self.assertTrue(files)
+        self.assertTrue(all(f.endswith('.pickle.codec') for f in files))
@@ -0,0 +1,55 @@
+from quickapp import QuickApp, quickapp_main
+from quickapp.streams import StreamHandle, save_stream
+from unittest.case import TestCase
+import os
+import shutil
+import tempfile
+
+
+def samples(n):
+    for i in range(n):
+        yield dict(i=i)
+
+
+def total(stream):
+    assert isinstance(stream, StreamHandle)
+    return sum(x['i'] for x in stream)
+
+
+class QuickAppStream(QuickApp):
+
+    cmd = 'quick-app-stream'
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        stream = context.comp_stream(samples, 25, chunk_size=10)
+        context.comp(total, stream)
+
+
+class StreamsTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def save_stream_test(self):
+        dirname = os.path.join(self.tmpdir, 's')
+        handle = save_stream(dirname, 10, samples, [25], {})
+        self.assertEqual((handle.nchunks, len(handle)), (3, 25))
+        self.assertEqual([x['i'] for x in handle], range(25))
+        self.assertEqual([len(c) for c in handle.iter_chunks()], [10, 10, 5])
+        # saving again replaces the chunks
+        handle = save_stream(dirname, 10, samples, [5], {})
+        self.assertEqual(sorted(os.listdir(dirname)), ['chunk-00000.pickle'])
+        self.assertEqual(len(list(handle)), 5)
+
+    def app_test(self):
+        args = ['-o', self.tmpdir, '-c', 'make']
+        ret = quickapp_main(QuickAppStream, args, sys_exit=False)
+        self.assertEqual(ret, 0)
+        chunks = os.listdir(os.path.join(self.tmpdir, 'streams', 'samples'))
+        self.assertEqual(len(chunks), 3)
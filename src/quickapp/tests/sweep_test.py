@@ -0,0 +1,31 @@
+from compmake import set_compmake_db
+from decent_params import DecentParams, Choice
+from quickapp import CompmakeContext
+from quickapp.app_utils import iterate_context_sweep
+from unittest.case import TestCase
+import shutil
+import tempfile
+
+
+def f(a, b):
+    return a * b
+
+
+class SweepTest(TestCase):
+
+    def context_sweep_test(self):
+        set_compmake_db({})
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        context = CompmakeContext(qapp=None, parent=None, job_prefix='sw',
+                                  output_dir=tmpdir)
+        p = DecentParams()
+        p.add_int('a', default=0)
+        p.add_string('b', default='x')
+        options = p.get_dpr_from_dict(dict(a=Choice([1, 2]),
+                                           b=Choice(['run_fast', 'run_slow'])))
+        job_ids = []
+        for c, options_i in iterate_context_sweep(context, options):
+            job_ids.append(c.comp(f, options_i.a, options_i.b).job_id)
+        self.assertEqual(job_ids, ['sw-a1_bfast-f', 'sw-a1_bslow-f',
+                                   'sw-a2_bfast-f', 'sw-a2_bslow-f'])
@@ -0,0 +1,47 @@
+from contracts import contract
+
+__all__ = ['contract_hot', 'strip_hot_contracts', 'restore_hot_contracts']
+
+
+def contract_hot(**kwargs):
+    """
+        Same as @contract(**kwargs), but for functions that are called
+        very often while defining the jobs.
+
+        The wrapper can be removed afterwards using strip_hot_contracts(),
+        so that there is no overhead at all when contracts are disabled.
+    """
+    def wrap(f):
+        wrapped = contract(**kwargs)(f)
+        if wrapped is not f:
+            wrapped.__undecorated__ = f
+        return wrapped
+    return wrap
+
+
+# list of (owner, name, value) for the attributes that were replaced
+_stripped = []
+
+
+def strip_hot_contracts(*owners):
+    """
+        Replaces the functions decorated with contract_hot in the given
+        classes or modules with the original undecorated functions.
+    """
+    for owner in owners:
+        for name, value in list(vars(owner).items()):
+            f = value.__func__ if isinstance(value, staticmethod) else value
+            original = getattr(f, '__undecorated__', None)
+            if original is None:
+                continue
+            if isinstance(value, staticmethod):
+                original = staticmethod(original)
+            setattr(owner, name, original)
+            _stripped.append((owner, name, value))
+
+
+def restore_hot_contracts():
+    """ Undoes all the changes done by strip_hot_contracts(). """
+    while _stripped:
+        owner, name, value = _stripped.pop()
+        setattr(owner, name, value)